@@ -0,0 +1,75 @@
+# ==========================================
+# MLang - Startup Time Benchmark
+# File: benchmarks/startup.py
+# ==========================================
+#
+# Measures how long a fresh interpreter takes to import main.py and build
+# an MLangApplication, and checks that no heavy module is imported on the
+# way. Exits non-zero when either guard fails:
+#
+#   python benchmarks/startup.py --runs 10 --max-ms 300
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+main.MLangApplication()
+elapsed = time.perf_counter() - start
+heavy = [m for m in main.HEAVY_MODULES + ("numpy",) if m in sys.modules]
+print(json.dumps({{"ms": elapsed * 1000, "heavy": heavy}}))
+"""
+
+
+def measure(runs):
+    samples = []
+    heavy = set()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(runs):
+            out = subprocess.run(
+                [sys.executable, "-c", PROBE.format(root=ROOT)],
+                cwd=workdir, capture_output=True, text=True, check=True
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            samples.append(result["ms"])
+            heavy.update(result["heavy"])
+
+    return samples, sorted(heavy)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MLang startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="fail if the median startup exceeds this")
+    args = parser.parse_args(argv)
+
+    samples, heavy = measure(args.runs)
+    report = {
+        "runs": args.runs,
+        "median_ms": round(statistics.median(samples), 2),
+        "min_ms": round(min(samples), 2),
+        "max_ms": round(max(samples), 2),
+        "heavy_modules_loaded": heavy,
+    }
+    print(json.dumps(report, indent=2))
+
+    failed = bool(heavy)
+    if args.max_ms is not None and report["median_ms"] > args.max_ms:
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# ==========================================
+# MLang - Statistics Benchmark
+# File: benchmarks/stats.py
+# ==========================================
+#
+# Times the Dataset statistics (median, percentiles, mode, variance)
+# against the naive way of getting the same answer: sorting every value
+# and reading the result off (np.unique / a Counter for the mode, a
+# two-pass np.var / fsum for the variance). Each run uses
+# a fresh Dataset, so no sorted index is carried over between runs.
+# Results are checked against the naive ones.
+#
+#   python benchmarks/stats.py --size 10000000 --runs 3
+#   python benchmarks/stats.py --size 1000000 --no-numpy
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from array import array
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.dataset import Dataset  # noqa: E402
+from utils.optional import numpy as _numpy  # noqa: E402
+
+# Set by --no-numpy: baselines and data generation use plain Python too
+NO_NUMPY = False
+
+
+def numpy():
+    return None if NO_NUMPY else _numpy()
+
+
+# --------------------------------------------------
+# NAIVE BASELINES
+# --------------------------------------------------
+def sort_all(values):
+    np = numpy()
+    return np.sort(values) if np else sorted(values)
+
+
+def naive_percentile(values, p):
+    ordered = sort_all(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return float(ordered[low] + (ordered[high] - ordered[low]) * (rank - low))
+
+
+def naive_mode(values):
+    np = numpy()
+    if np:
+        unique, counts = np.unique(values, return_counts=True)
+        best = int(counts.argmax())
+        return float(unique[best]), int(counts[best])
+    counts = Counter(values)
+    top = max(counts.values())
+    return min(v for v, c in counts.items() if c == top), top
+
+
+def naive_variance(values):
+    np = numpy()
+    if np:
+        return float(np.var(values, ddof=1))
+    mean = math.fsum(values) / len(values)
+    return math.fsum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+
+STATISTICS = {
+    "median": (lambda d: d.median(), lambda v: naive_percentile(v, 50)),
+    "p99": (lambda d: d.percentile(99), lambda v: naive_percentile(v, 99)),
+    "mode": (lambda d: d.mode(), naive_mode),
+    "variance": (lambda d: d.variance(), naive_variance),
+}
+
+
+# --------------------------------------------------
+# MEASUREMENT
+# --------------------------------------------------
+def generate(size, seed):
+    # Rounded to one decimal so that values repeat and the mode means something
+    np = numpy()
+    if np:
+        return np.round(np.random.default_rng(seed).normal(50, 15, size), 1)
+    rng = random.Random(seed)
+    return array("d", (round(rng.gauss(50, 15), 1) for _ in range(size)))
+
+
+def best_of(runs, function, *args):
+    times, result = [], None
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times), result
+
+
+def close(a, b):
+    if isinstance(a, tuple):
+        return a[1] == b[1] and a[0] == b[0]
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MLang statistics benchmark")
+    parser.add_argument("--size", type=int, default=10 ** 7)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-numpy", action="store_true",
+                        help="use the array-module code paths only")
+    args = parser.parse_args(argv)
+
+    global NO_NUMPY
+    if args.no_numpy:
+        NO_NUMPY = True
+        Dataset.VECTOR_MIN = sys.maxsize
+
+    values = generate(args.size, args.seed)
+    dataset = Dataset(values)
+
+    report = {"size": args.size, "numpy": bool(numpy()), "statistics": {}}
+    failed = False
+    for name, (fast, naive) in STATISTICS.items():
+        fast_ms, result = best_of(args.runs, lambda: fast(Dataset(dataset)))
+        naive_ms, expected = best_of(args.runs, naive, values)
+        agrees = close(result, expected)
+        failed |= not agrees
+        report["statistics"][name] = {
+            "ms": round(fast_ms, 2),
+            "naive_ms": round(naive_ms, 2),
+            "speedup": round(naive_ms / fast_ms, 1),
+            "agrees": agrees,
+        }
+
+    print(json.dumps(report, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# ==========================================
+# MLang - Benchmark Suite
+# File: benchmarks/suite.py
+# ==========================================
+#
+# Drives MLangApplication.execute with generated utterances for every
+# domain, plus assignment and undo/redo, and reports latency percentiles,
+# throughput and peak traced memory per workload and dataset size.
+#
+#   python benchmarks/suite.py --max-size 1000000 --output before.json
+#   python benchmarks/suite.py --output after.json --compare before.json
+#
+# Workloads on named data (data, assign, undo_redo) run once per size;
+# the others do not depend on data size and run once. Everything runs in
+# a temporary directory, so the store and caches start empty and the
+# working tree is left alone.
+#
+# The response cache is off unless --response-cache is given: the data
+# corpus repeats its queries, and every repeat would otherwise time a
+# cache lookup instead of the query.
+
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SIZES = [10 ** k for k in range(2, 8)]
+MAX_SIZE = 10 ** 6
+
+
+# --------------------------------------------------
+# CORPORA
+# --------------------------------------------------
+# Each workload returns (setup, corpus): setup lines run untimed, corpus
+# lines are timed one by one.
+
+def data_workload(size, rng):
+    setup = [assignment("marks", size, rng)]
+    corpus = []
+    for _ in range(5):
+        t = rng.uniform(0, 100)
+        corpus += [
+            "find best of marks",
+            "find min of marks",
+            "find max of marks",
+            f"find best of marks where value > {t:.1f}",
+            f"find min of marks above {t:.1f}",
+            f"find max of marks below {t:.1f}",
+            f"find highest below {t:.1f} of marks",
+            f"find lowest above {t:.1f} of marks",
+            f"find closest to {t:.1f} in marks",
+            "sort values in marks",
+        ]
+    return setup, corpus
+
+
+def assign_workload(size, rng):
+    return [], [assignment(f"data{i}", size, rng) for i in range(5)]
+
+
+def undo_redo_workload(size, rng):
+    setup = [assignment(f"data{i}", size, rng) for i in range(5)]
+    corpus = ["undo", "undo", "redo", "redo", "undo 3", "redo 3"] * 3
+    return setup, corpus
+
+
+def math_workload(size, rng):
+    corpus = []
+    for _ in range(20):
+        a, b, c = (rng.randint(1, 50) for _ in range(3))
+        corpus += [
+            f"calculate {a} + {b} * {c}",
+            f"evaluate ({a} - {b}) ^ 2 / {c}",
+            f"solve {a}x + {b} = {c}",
+        ]
+    return [], corpus
+
+
+def math_reasoning_workload(size, rng):
+    corpus = []
+    for _ in range(20):
+        a, b = rng.randint(1, 50), rng.randint(51, 100)
+        corpus += [
+            f"a number increased by {a} becomes {b}",
+            f"the sum of a number and {a} is {b}",
+            f"a car travels {b} km in {a} hours",
+            f"{a} percent of {b}",
+        ]
+    return [], corpus
+
+
+def calculus_workload(size, rng):
+    corpus = []
+    for _ in range(10):
+        a = rng.randint(1, 9)
+        corpus += [
+            f"∫ {a}x^2 + x dx",
+            f"integral of {a}x^3",
+            f"area under x^2 + {a} from 0 to {a}",
+            f"definite integral of sin(x) * {a} from 0 to 3",
+            f"integral of exp(-x^2) from -{a} to {a}",
+        ]
+    return [], corpus
+
+
+def advanced_math_workload(size, rng):
+    corpus = []
+    for _ in range(5):
+        a = rng.randint(1, 9)
+        corpus += [
+            f"limit of sin({a}x)/x as x -> 0",
+            f"limit of (x^2 - {a * a})/(x - {a}) as x -> {a}",
+            "limit of (1 - cos(x))/x^2 as x -> 0",
+        ]
+    return [], corpus
+
+
+def knowledge_workload(size, rng):
+    corpus = []
+    for concept in ["gravity", "mean", "speed", "force", "energy"] * 4:
+        corpus += [
+            f"what is {concept}",
+            f"explain {concept}",
+            f"forget {concept}",
+            # Typo and plural: answered through the trigram index
+            f"what is {concept[:2]}{concept[3:]}",
+            f"what is {concept}s",
+            # Unknown concept, declined: no external lookup
+            "what is " + "".join(rng.choice("qxzjvk") for _ in range(8)),
+            "no",
+        ]
+    return [], corpus
+
+
+def why_workload(size, rng):
+    corpus = []
+    for _ in range(20):
+        corpus += [f"calculate {rng.randint(1, 99)} * 3", "why"]
+    return [], corpus
+
+
+def assignment(name, size, rng):
+    values = ", ".join(f"{rng.uniform(0, 100):.2f}" for _ in range(size))
+    return f"{name} = {values}"
+
+
+# name -> (corpus factory, scales with size, modules it needs)
+WORKLOADS = {
+    "data": (data_workload, True, ()),
+    "assign": (assign_workload, True, ()),
+    "undo_redo": (undo_redo_workload, True, ()),
+    "math": (math_workload, False, ()),
+    "math_reasoning": (math_reasoning_workload, False, ()),
+    "calculus": (calculus_workload, False, ()),
+    "advanced_math": (advanced_math_workload, False, ("sympy",)),
+    "knowledge": (knowledge_workload, False, ()),
+    "why": (why_workload, False, ()),
+}
+
+
+# --------------------------------------------------
+# MEASUREMENT
+# --------------------------------------------------
+def percentile(samples, p):
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def fresh_app(workdir, response_cache):
+    from main import MLangApplication
+
+    # A directory per app, so no store or cache carries over between runs
+    os.chdir(tempfile.mkdtemp(dir=workdir))
+    app = MLangApplication(cache_responses=response_cache)
+    app.engine.execute = app.execute
+    return app
+
+
+def run(app, line):
+    return app.engine.handle(line)
+
+
+def measure(name, size, seed, workdir, response_cache=False):
+    factory = WORKLOADS[name][0]
+    setup, corpus = factory(size, random.Random(seed))
+
+    # Timed pass
+    app = fresh_app(workdir, response_cache)
+    try:
+        for line in setup:
+            run(app, line)
+        latencies = []
+        start = time.perf_counter()
+        for line in corpus:
+            t0 = time.perf_counter()
+            run(app, line)
+            latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - start
+    finally:
+        app.store.close()
+
+    # Traced pass, separate because tracing slows everything down
+    app = fresh_app(workdir, response_cache)
+    try:
+        for line in setup:
+            run(app, line)
+        tracemalloc.start()
+        for line in corpus:
+            run(app, line)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        app.store.close()
+
+    ms = [t * 1000 for t in latencies]
+    return {
+        "workload": name,
+        "size": size,
+        "ops": len(corpus),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p95_ms": round(percentile(ms, 95), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "ops_per_s": round(len(corpus) / elapsed, 2),
+        "peak_bytes": peak,
+    }
+
+
+def run_suite(workloads, sizes, seed, response_cache=False):
+    results = []
+    skipped = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        try:
+            for name in workloads:
+                _, scales, needs = WORKLOADS[name]
+                missing = [m for m in needs if importlib.util.find_spec(m) is None]
+                if missing:
+                    skipped.append({"workload": name, "missing": missing})
+                    continue
+
+                for size in (sizes if scales else [None]):
+                    result = measure(name, size, seed, workdir, response_cache)
+                    results.append(result)
+                    print(format_row(result), file=sys.stderr)
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": importlib.util.find_spec("numpy") is not None,
+            "seed": seed,
+            "response_cache": response_cache,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+
+# --------------------------------------------------
+# REPORTING
+# --------------------------------------------------
+def format_row(r):
+    size = "-" if r["size"] is None else r["size"]
+    return (
+        f"{r['workload']:<15} {size:>9} {r['ops']:>5} ops  "
+        f"p50 {r['p50_ms']:>10.3f} ms  p95 {r['p95_ms']:>10.3f} ms  "
+        f"p99 {r['p99_ms']:>10.3f} ms  {r['ops_per_s']:>10.1f} ops/s  "
+        f"peak {r['peak_bytes'] / 1e6:>8.2f} MB"
+    )
+
+
+def compare(report, baseline, threshold):
+    """
+    Print p50 / p99 / peak ratios against a baseline report.
+    Returns the rows whose p50 got slower than `threshold` times.
+    """
+    before = {(r["workload"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+
+    for r in report["results"]:
+        old = before.get((r["workload"], r["size"]))
+        if old is None:
+            continue
+
+        ratios = {
+            key: r[key] / old[key] if old[key] else float("inf")
+            for key in ("p50_ms", "p99_ms", "peak_bytes")
+        }
+        flag = ratios["p50_ms"] > threshold
+        if flag:
+            regressions.append(r)
+
+        size = "-" if r["size"] is None else r["size"]
+        print(
+            f"{r['workload']:<15} {size:>9}  "
+            f"p50 x{ratios['p50_ms']:.2f}  p99 x{ratios['p99_ms']:.2f}  "
+            f"peak x{ratios['peak_bytes']:.2f}" + ("  REGRESSION" if flag else "")
+        )
+
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MLang benchmark suite")
+    parser.add_argument(
+        "--workload", action="append", choices=sorted(WORKLOADS),
+        help="run only this workload (repeatable; default: all)"
+    )
+    parser.add_argument(
+        "--max-size", type=float, default=MAX_SIZE,
+        help="largest dataset size (default: 1e6; up to 1e7)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--response-cache", action="store_true",
+        help="answer repeated inputs from the response cache, as the app does"
+    )
+    parser.add_argument("--output", metavar="FILE", help="write the JSON report here")
+    parser.add_argument("--compare", metavar="FILE", help="baseline JSON report")
+    parser.add_argument(
+        "--threshold", type=float, default=1.25,
+        help="with --compare, fail when p50 grows past this ratio"
+    )
+    args = parser.parse_args(argv)
+
+    sizes = [n for n in SIZES if n <= args.max_size]
+    report = run_suite(
+        args.workload or list(WORKLOADS), sizes, args.seed, args.response_cache
+    )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import weakref
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+
+
+# last_decision was left as it was by the domain
+UNCHANGED = object()
+
+Entry = namedtuple(
+    "Entry", ["domain", "trigger", "message", "decision", "memory_version", "deps"]
+)
+
+
+class ReadLog(MutableMapping):
+    """
+    data_store as one domain sees it: everything goes through to the real
+    store, and the keys looked up (found or not) are recorded, so a cached
+    response depends on exactly the entries that were read. Listing the
+    store sets `scanned`: such a response depends on every entry.
+    """
+
+    def __init__(self, data_store):
+        self.data_store = data_store
+        self.read = {}              # keys in the order they were read
+        self.scanned = False
+
+    def __getitem__(self, key):
+        self.read[key] = None
+        return self.data_store[key]
+
+    def __contains__(self, key):
+        self.read[key] = None
+        return key in self.data_store
+
+    def __setitem__(self, key, value):
+        self.data_store[key] = value
+
+    def __delitem__(self, key):
+        del self.data_store[key]
+
+    def __iter__(self):
+        self.scanned = True
+        return iter(self.data_store)
+
+    def __len__(self):
+        self.scanned = True
+        return len(self.data_store)
+
+
+class ResponseCache:
+    """
+    Responses of deterministic domains, keyed on the normalized input.
+
+    An entry is only valid while everything it was computed from is
+    unchanged: the datasets named by the input's tokens or read by the
+    domain (see ReadLog) and, for domains
+    that read it, Memory (through Memory.version). Datasets are never edited
+    in place, only replaced, so a dataset's identity is its version; entries
+    hold weak references, so a cached response never keeps a replaced
+    dataset alive. Any change (assignment, derived recompute, undo, redo,
+    a merge from another process) therefore invalidates exactly the
+    entries that read the changed key, and undoing a change makes them
+    valid again.
+    """
+
+    MAX_ENTRIES = 4096
+
+    def __init__(self, max_entries=None):
+        self.max_entries = ResponseCache.MAX_ENTRIES if max_entries is None else max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, utterance, context):
+        entry = self.entries.get(utterance.text)
+        if entry is not None and self._valid(entry, context):
+            self.entries.move_to_end(utterance.text)
+            self.hits += 1
+            return entry
+
+        if entry is not None:
+            del self.entries[utterance.text]
+        self.misses += 1
+        return None
+
+    def put(self, utterance, context, domain, trigger, message, decision, reads=None):
+        """
+        Cache a response. `reads` is the ReadLog the domain handled the
+        input with; without one, the input's tokens are the dependencies.
+        """
+        if reads is not None and reads.scanned:
+            return
+        data_store = context["data_store"]
+        deps = []
+        keys = utterance.tokens + tuple(reads.read) if reads is not None else utterance.tokens
+        for token in dict.fromkeys(keys):
+            value = data_store.get(token)
+            if value is None:
+                deps.append((token, None))
+                continue
+            try:
+                deps.append((token, weakref.ref(value)))
+            except TypeError:
+                return
+
+        version = context["memory"].version if domain.reads_memory else None
+        self.entries[utterance.text] = Entry(
+            domain.name, trigger, message, decision, version, tuple(deps)
+        )
+        self.entries.move_to_end(utterance.text)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _valid(self, entry, context):
+        if entry.memory_version is not None and entry.memory_version != context["memory"].version:
+            return False
+
+        data_store = context["data_store"]
+        for token, ref in entry.deps:
+            current = data_store.get(token)
+            if ref is None:
+                if current is not None:
+                    return False
+            elif current is None or ref() is not current:
+                return False
+        return True
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
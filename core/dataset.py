@@ -0,0 +1,408 @@
+import base64
+import math
+import operator
+import sys
+import weakref
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from functools import partial
+from itertools import repeat
+
+from utils.optional import numpy as _np
+
+
+# Comparators as (vector op, element predicate).
+# The predicate is bound to the right-hand side: partial(lt, rhs)(v) is
+# rhs < v, i.e. v > rhs. Both run without a Python-level loop.
+_COMPARATORS = {
+    ">": (operator.gt, operator.lt),
+    "<": (operator.lt, operator.gt),
+    ">=": (operator.ge, operator.le),
+    "<=": (operator.le, operator.ge),
+    "==": (operator.eq, operator.eq),
+}
+
+_ARITHMETIC = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+
+
+class Dataset:
+    """
+    Immutable series of numbers backed by a contiguous buffer of doubles.
+
+    The buffer is an array('d') or a read-only memoryview of format 'd'
+    (a NumPy result or a mapped file). Filters, min/max and sort run in C:
+    through NumPy for large datasets when it is available, and through
+    the array module otherwise. Datasets are never modified in place;
+    every operation returns a new one.
+
+    A sorted copy of the values is built on the first ordered query
+    (sort, closest, highest below, ...) and kept with the dataset, so
+    later ordered queries are answered by bisection. Because datasets are
+    replaced on reassignment, a stale index can never be observed.
+
+    A dataset loaded from a file (see utils/datafile.py) keeps a reference
+    to it in `source`; it is stored as that reference, not as values.
+    """
+
+    # __weakref__: the response cache (core/cache.py) refers to datasets weakly
+    __slots__ = ("values", "source", "_index", "_base", "__weakref__")
+
+    # Datasets smaller than this are not worth a NumPy round-trip.
+    VECTOR_MIN = 4096
+
+    # Values per block in a vectorized variance pass (512 KiB of doubles).
+    BLOCK = 1 << 16
+
+    # How many values repr() shows before eliding the middle.
+    PREVIEW = 20
+
+    def __init__(self, values=()):
+        self._index = None
+        self.source = None
+        self._base = None           # weakref to the dataset this one appended to
+
+        if isinstance(values, Dataset):
+            values = values.values
+
+        if isinstance(values, array) and values.typecode == "d":
+            self.values = values
+        elif isinstance(values, memoryview) and values.format == "d":
+            self.values = values.toreadonly()
+        elif hasattr(values, "__array_interface__") and _np():
+            vector = _np().ascontiguousarray(values, dtype=_np().float64)
+            self.values = memoryview(vector).toreadonly()
+        else:
+            self.values = array("d", values)
+
+    # --------------------------------------------------
+    # SEQUENCE PROTOCOL
+    # --------------------------------------------------
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Dataset(self.values[index])
+        return self.values[index]
+
+    def __eq__(self, other):
+        if isinstance(other, Dataset):
+            other = other.values
+        if not isinstance(other, (array, memoryview, list, tuple)):
+            return NotImplemented
+        return len(self) == len(other) and all(map(operator.eq, self.values, other))
+
+    __hash__ = None
+
+    def __repr__(self):
+        if len(self) <= Dataset.PREVIEW:
+            return repr(self.to_list())
+
+        head = ", ".join(map(repr, self.values[:Dataset.PREVIEW - 2].tolist()))
+        tail = ", ".join(map(repr, self.values[-2:].tolist()))
+        return f"[{head}, …, {tail}] ({len(self)} values)"
+
+    def __sizeof__(self):
+        size = object.__sizeof__(self)
+        if self.source is None or not isinstance(self.values, memoryview):
+            # A file mapping is backed by the page cache, not the heap
+            size += memoryview(self.values).nbytes
+        if self._index is not None and self._index is not self.values:
+            size += memoryview(self._index).nbytes
+        return size
+
+    def to_list(self):
+        return self.values.tolist()
+
+    def appended(self, other):
+        """
+        A new dataset with the values of `other` after these. The values
+        are copied in one block; the result remembers it extends this
+        dataset, so a store can save only the new values (see extends).
+        """
+        values = array("d")
+        values.frombytes(memoryview(self.values).cast("B"))
+        values.frombytes(memoryview(Dataset(other).values).cast("B"))
+        result = Dataset(values)
+        result._base = weakref.ref(self)
+        return result
+
+    def extends(self, other):
+        """
+        Whether this dataset was made by appending to `other` (that very
+        object); its new values are then self[len(other):].
+        """
+        return self._base is not None and self._base() is other
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+    def _vector(self):
+        """
+        A zero-copy NumPy view of the values, or None.
+        """
+        if len(self) < Dataset.VECTOR_MIN or not _np():
+            return None
+        return _np().frombuffer(self.values, dtype=_np().float64)
+
+    def where(self, op, rhs):
+        """
+        Keep the values v for which `v <op> rhs` holds.
+        """
+        vector_op, predicate = _COMPARATORS[op]
+
+        vector = self._vector()
+        if vector is not None:
+            return Dataset(vector[vector_op(vector, rhs)])
+
+        return Dataset(array("d", filter(partial(predicate, rhs), self.values)))
+
+    def min(self):
+        if self._index is not None:
+            return self._index[0]
+        vector = self._vector()
+        return float(vector.min()) if vector is not None else min(self.values)
+
+    def max(self):
+        if self._index is not None:
+            return self._index[-1]
+        vector = self._vector()
+        return float(vector.max()) if vector is not None else max(self.values)
+
+    def sum(self):
+        # fsum is exact, so the result does not depend on the order
+        return math.fsum(self.values)
+
+    def mean(self):
+        return self.sum() / len(self)
+
+    def sorted(self):
+        result = Dataset(self.index())
+        result._index = result.values
+        return result
+
+    # --------------------------------------------------
+    # STATISTICS
+    # --------------------------------------------------
+    def variance(self):
+        """
+        Sample variance (dividing by n - 1; 0.0 for a single value), in one
+        pass with Welford's update. Large datasets are read in blocks whose
+        mean and squared deviations NumPy computes, merged with the same
+        update (Chan et al.), so the result stays accurate when the values
+        are large and close together.
+        """
+        n, mean, m2 = 0, 0.0, 0.0
+
+        vector = self._vector()
+        if vector is not None:
+            for start in range(0, len(vector), Dataset.BLOCK):
+                block = vector[start:start + Dataset.BLOCK]
+                size, block_mean = len(block), float(block.mean())
+                deviations = block - block_mean
+                delta, total = block_mean - mean, n + size
+                mean += delta * size / total
+                m2 += float(_np().dot(deviations, deviations)) + delta * delta * n * size / total
+                n = total
+        else:
+            for value in self.values:
+                n += 1
+                delta = value - mean
+                mean += delta / n
+                m2 += delta * (value - mean)
+
+        return m2 / (n - 1) if n > 1 else 0.0
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def percentile(self, p):
+        """
+        The p-th percentile (0-100), interpolating linearly between the two
+        nearest ranks. Only those ranks are selected: from the sorted index
+        if it exists, with NumPy's introselect for large datasets, and by
+        sorting small ones.
+        """
+        rank = (len(self) - 1) * p / 100
+        low = math.floor(rank)
+        high = min(low + 1, len(self) - 1)
+        a, b = self._ranks(low, high)
+        return a + (b - a) * (rank - low)
+
+    def median(self):
+        return self.percentile(50)
+
+    def distinct(self):
+        """
+        How many different values there are.
+        """
+        vector = self._vector()
+        if vector is not None:
+            return len(_np().unique(vector))
+        return len(set(self.values))
+
+    def _ranks(self, low, high):
+        """
+        The values at positions `low` and `high` (= low or low + 1) of
+        the sorted order.
+        """
+        if self._index is None:
+            vector = self._vector()
+            if vector is not None:
+                # One partition point: everything after `low` is >= it, and
+                # its minimum is the next rank.
+                part = _np().partition(vector, low)
+                following = part[low + 1:].min() if high > low else part[low]
+                return float(part[low]), float(following)
+
+        index = self.index()
+        return index[low], index[high]
+
+    def mode(self):
+        """
+        The most frequent value and how often it occurs; ties go to the
+        smaller value. Small datasets are counted in a hash table, large
+        ones as runs of the sorted index.
+        """
+        vector = self._vector()
+        if vector is None:
+            counts = Counter(self.values)
+            top = max(counts.values())
+            return min(v for v, c in counts.items() if c == top), top
+
+        index = _np().frombuffer(self.index(), dtype=_np().float64)
+        starts = _np().flatnonzero(_np().concatenate(([True], index[1:] != index[:-1])))
+        counts = _np().diff(_np().append(starts, len(index)))
+        best = int(counts.argmax())
+        return float(index[starts[best]]), int(counts[best])
+
+    # --------------------------------------------------
+    # ARITHMETIC
+    # --------------------------------------------------
+    def combine(self, op, other, reflected=False):
+        """
+        Apply `op` ("+", "-", "*", "/") value by value with a dataset of
+        the same length, or with a number for every value. `reflected`
+        puts `other` on the left. Raises ValueError on a length mismatch
+        and ZeroDivisionError on a division by zero.
+        """
+        function = _ARITHMETIC[op]
+        scalar = not isinstance(other, Dataset)
+        if not scalar and len(other) != len(self):
+            raise ValueError(f"lengths differ: {len(self)} and {len(other)}")
+
+        vector = self._vector()
+        if vector is not None:
+            right = float(other) if scalar else _np().frombuffer(other.values, dtype=_np().float64)
+            left, right = (right, vector) if reflected else (vector, right)
+            if op == "/" and _np().any(right == 0):
+                raise ZeroDivisionError("division by zero")
+            return Dataset(function(left, right))
+
+        right = repeat(float(other)) if scalar else other.values
+        left, right = (right, self.values) if reflected else (self.values, right)
+        return Dataset(array("d", map(function, left, right)))
+
+    def dot(self, other):
+        """
+        Sum of the products of matching values.
+        """
+        if len(other) != len(self):
+            raise ValueError(f"lengths differ: {len(self)} and {len(other)}")
+
+        vector = self._vector()
+        if vector is not None:
+            return float(_np().dot(vector, _np().frombuffer(other.values, dtype=_np().float64)))
+        return math.fsum(map(operator.mul, self.values, other.values))
+
+    # --------------------------------------------------
+    # SORTED INDEX
+    # --------------------------------------------------
+    def index(self):
+        """
+        The values in ascending order, built once on first use.
+        """
+        if self._index is None:
+            vector = self._vector()
+            if vector is not None:
+                self._index = memoryview(_np().sort(vector)).toreadonly()
+            else:
+                self._index = array("d", sorted(self.values))
+        return self._index
+
+    def highest_below(self, target):
+        """
+        The largest value < target, or None.
+        """
+        index = self.index()
+        i = bisect_left(index, target)
+        return index[i - 1] if i > 0 else None
+
+    def lowest_above(self, target):
+        """
+        The smallest value > target, or None.
+        """
+        index = self.index()
+        i = bisect_right(index, target)
+        return index[i] if i < len(index) else None
+
+    def closest(self, target):
+        """
+        The value nearest to target; ties go to the smaller value.
+        """
+        index = self.index()
+        if not len(index):
+            return None
+
+        i = bisect_left(index, target)
+        candidates = [index[j] for j in (i - 1, i) if 0 <= j < len(index)]
+        return min(candidates, key=lambda v: (abs(v - target), v))
+
+    # --------------------------------------------------
+    # SERIALIZATION
+    # --------------------------------------------------
+    def encode(self):
+        """
+        Compact JSON form: little-endian doubles, base64 encoded, or the
+        file reference of a loaded dataset.
+        """
+        if self.source is not None:
+            return {"type": "dataset", "file": self.source}
+
+        raw = self.values
+        if sys.byteorder != "little":
+            raw = array("d", raw)
+            raw.byteswap()
+        return {"type": "dataset", "f64le": base64.b64encode(raw).decode("ascii")}
+
+    @classmethod
+    def decode(cls, payload):
+        if "file" in payload:
+            from utils.datafile import reopen
+            return reopen(payload["file"])
+
+        values = array("d")
+        values.frombytes(base64.b64decode(payload["f64le"]))
+        if sys.byteorder != "little":
+            values.byteswap()
+        return cls(values)
+
+    @classmethod
+    def coerce(cls, value):
+        """
+        Turn a stored value (encoded dataset or legacy list) into a Dataset.
+        """
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict) and value.get("type") == "dataset":
+            return cls.decode(value)
+        return cls(value)
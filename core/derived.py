@@ -0,0 +1,325 @@
+import re
+
+from core.dataset import Dataset
+
+
+# "<aggregate> of <dataset>", e.g. avg_marks = average of marks
+AGGREGATES = {
+    "average": "mean",
+    "mean": "mean",
+    "sum": "sum",
+    "total": "sum",
+    "min": "min",
+    "minimum": "min",
+    "max": "max",
+    "maximum": "max",
+    "count": "count",
+    "median": "median",
+    "variance": "variance",
+    "standard deviation": "stddev",
+    "stddev": "stddev",
+}
+
+_AGGREGATE = re.compile(
+    rf"({'|'.join(AGGREGATES)}) of ([a-z_][\w]*)"
+)
+
+# "dot of a and b", "dot product of a and b"
+_DOT = re.compile(r"dot(?: product)? of ([a-z_]\w*) and ([a-z_]\w*)")
+
+# Element-wise arithmetic: "marks + bonus", "(a - b) / 2"
+_ARITHMETIC_TOKEN = re.compile(
+    r"\s*(?:([a-z_]\w*)|((?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)|([-+*/()]))"
+)
+_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2, "neg": 3}
+
+
+class DerivedError(ValueError):
+    pass
+
+
+class Formula:
+    """
+    How a derived value is computed from other datasets.
+
+    `op` is an aggregate ("mean", "sum", ...), "dot", or "arithmetic",
+    in which case `program` holds the expression in postfix order as
+    ("name", x), ("number", 1.5) and ("op", "+") steps.
+    """
+
+    def __init__(self, text, op, sources, program=None):
+        self.text = text
+        self.op = op
+        self.sources = sources
+        self.program = program
+
+    @property
+    def description(self):
+        if self.op == "arithmetic":
+            return f"{self.text}, value by value"
+        if self.op == "dot":
+            a, b = self.sources
+            return f"the dot product of {a} and {b}"
+        return f"the {self.text}"
+
+    def evaluate(self, data_store):
+        if self.op == "arithmetic":
+            return self._arithmetic(data_store)
+
+        if self.op == "dot":
+            a, b = (data_store[s] for s in self.sources)
+            if len(a) != len(b):
+                raise DerivedError(_mismatch(self.sources, (a, b), "a dot product"))
+            return Dataset([a.dot(b)])
+
+        values = data_store[self.sources[0]]
+        if not values:
+            raise DerivedError(f"'{self.sources[0]}' is empty")
+
+        if self.op == "count":
+            return Dataset([len(values)])
+        return Dataset([getattr(values, self.op)()])
+
+    def _arithmetic(self, data_store):
+        # A single value is used for every position; other lengths must agree
+        datasets = {s: data_store[s] for s in self.sources}
+        longer = [s for s in self.sources if len(datasets[s]) != 1]
+        for s in longer[1:]:
+            if len(datasets[s]) != len(datasets[longer[0]]):
+                pair = (longer[0], s)
+                raise DerivedError(_mismatch(
+                    pair, [datasets[p] for p in pair], "element-wise arithmetic"
+                ))
+
+        stack = []
+        for kind, value in self.program:
+            if kind == "number":
+                stack.append(value)
+            elif kind == "name":
+                dataset = datasets[value]
+                stack.append(dataset[0] if len(dataset) == 1 else dataset)
+            elif value == "neg":
+                operand = stack.pop()
+                stack.append(-operand if isinstance(operand, float) else operand.combine("*", -1.0))
+            else:
+                right = stack.pop()
+                stack.append(_combine(value, stack.pop(), right))
+
+        result = stack.pop()
+        return result if isinstance(result, Dataset) else Dataset([result])
+
+
+def _combine(op, left, right):
+    try:
+        if isinstance(left, Dataset):
+            return left.combine(op, right)
+        if isinstance(right, Dataset):
+            return right.combine(op, left, reflected=True)
+        return Dataset([left]).combine(op, right)[0]
+    except ZeroDivisionError:
+        raise DerivedError("it divides by zero")
+
+
+def _mismatch(names, datasets, what):
+    (a, b), (x, y) = names, datasets
+    return (
+        f"'{a}' has {len(x)} values and '{b}' has {len(y)}; "
+        f"{what} needs the same number of values"
+        + (" (or a single value)" if what == "element-wise arithmetic" else "")
+    )
+
+
+def _parse_arithmetic(text):
+    """
+    Names and numbers joined by + - * / and parentheses, with the usual
+    precedence, as (postfix program, names); None if `text` is not such
+    an expression or uses no dataset or no operator.
+    """
+    program, operators, names = [], [], []
+    expect_operand = True
+    position = 0
+
+    while position < len(text):
+        m = _ARITHMETIC_TOKEN.match(text, position)
+        if not m or m.end() == position:
+            return None
+        position = m.end()
+        name, number, symbol = m.groups()
+
+        if expect_operand:
+            if name:
+                program.append(("name", name))
+                names.append(name)
+                expect_operand = False
+            elif number:
+                program.append(("number", float(number)))
+                expect_operand = False
+            elif symbol == "(":
+                operators.append("(")
+            elif symbol == "-":
+                operators.append("neg")
+            else:
+                return None
+            continue
+
+        if symbol == ")":
+            while operators and operators[-1] != "(":
+                program.append(("op", operators.pop()))
+            if not operators:
+                return None
+            operators.pop()
+        elif symbol in _PRECEDENCE:
+            while (
+                operators and operators[-1] != "("
+                and _PRECEDENCE[operators[-1]] >= _PRECEDENCE[symbol]
+            ):
+                program.append(("op", operators.pop()))
+            operators.append(symbol)
+            expect_operand = True
+        else:
+            return None
+
+    if expect_operand or "(" in operators:
+        return None
+    while operators:
+        program.append(("op", operators.pop()))
+
+    if not names or not any(kind == "op" and v != "neg" for kind, v in program):
+        return None
+    return tuple(program), tuple(dict.fromkeys(names))
+
+
+def parse_formula(text):
+    """
+    Return a Formula if `text` describes a derived value, else None.
+    """
+    text = " ".join(text.lower().split())
+    m = _AGGREGATE.fullmatch(text)
+    if m:
+        return Formula(text, AGGREGATES[m.group(1)], (m.group(2),))
+
+    m = _DOT.fullmatch(text)
+    if m:
+        return Formula(text, "dot", m.groups())
+
+    parsed = _parse_arithmetic(text)
+    if parsed:
+        program, names = parsed
+        return Formula(text, "arithmetic", names, program)
+    return None
+
+
+class DerivedValues:
+    """
+    Dependency graph of derived data_store entries.
+
+    Each derived name keeps the formula it was defined with. When a source
+    changes, only the names that depend on it, directly or through other
+    derived values, are recomputed, in topological order.
+    """
+
+    def __init__(self):
+        self.definitions = {}       # name -> formula text
+        self._formulas = {}         # name -> Formula
+        self._dependents = {}       # source -> {derived name: None}, in definition order
+
+    # --------------------------------------------------
+    # DEFINITIONS
+    # --------------------------------------------------
+    def get(self, name):
+        return self.definitions.get(name)
+
+    def set(self, name, text):
+        formula = parse_formula(text)
+        if formula is None:
+            raise DerivedError(f"'{text}' is not a derived value")
+        if name in self.upstream(formula.sources):
+            raise DerivedError(f"'{name}' would depend on itself")
+
+        self.remove(name)
+        self.definitions[name] = text
+        self._formulas[name] = formula
+        for source in formula.sources:
+            self._dependents.setdefault(source, {})[name] = None
+
+    def remove(self, name):
+        if name not in self.definitions:
+            return
+        for source in self._formulas[name].sources:
+            self._dependents[source].pop(name, None)
+        del self.definitions[name]
+        del self._formulas[name]
+
+    def formula(self, name):
+        return self._formulas.get(name)
+
+    def upstream(self, names):
+        seen = set()
+        stack = list(names)
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            if name in self._formulas:
+                stack.extend(self._formulas[name].sources)
+        return seen
+
+    # --------------------------------------------------
+    # PROPAGATION
+    # --------------------------------------------------
+    def affected(self, name):
+        """
+        Every derived value downstream of `name`, in an order where each
+        comes after everything it depends on; values that don't depend on
+        each other keep the order they were defined in.
+        """
+        order = []
+        done = set()
+
+        def visit(node):
+            # Reversed, because the finishing order is reversed below
+            for child in reversed(self._dependents.get(node, {})):
+                if child not in done:
+                    done.add(child)
+                    visit(child)
+                    order.append(child)
+
+        visit(name)
+        order.reverse()
+        return order
+
+    def recompute(self, data_store, names):
+        """
+        Recompute `names` (as returned by affected) into data_store.
+        Values that can't be computed (a source missing, empty or of the
+        wrong length) are left as they were. Returns the recomputed names
+        and {name: reason} for those that failed for a reason to report.
+        """
+        updated, failed = [], {}
+        for name in names:
+            try:
+                data_store[name] = self._formulas[name].evaluate(data_store)
+            except KeyError:
+                continue
+            except DerivedError as exc:
+                failed[name] = str(exc)
+                continue
+            updated.append(name)
+        return updated, failed
+
+    # --------------------------------------------------
+    # PERSISTENCE
+    # --------------------------------------------------
+    def export(self):
+        return self.definitions
+
+    def load(self, definitions):
+        self.definitions = {}
+        self._formulas = {}
+        self._dependents = {}
+        for name, text in (definitions or {}).items():
+            try:
+                self.set(name, text)
+            except DerivedError:
+                continue
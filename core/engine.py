@@ -1,5 +1,4 @@
 from core.states import STATE_REGISTRY
-import copy
 
 
 class Engine:
@@ -12,54 +11,24 @@ class Engine:
 
     # ---------------- UNDO ----------------
     def undo(self, steps=1):
-        history = self.context.get("history", [])
-        future = self.context.get("future", [])
+        history = self.context.get("history")
 
-        if not history:
+        if not history or not history.done:
             return "There is nothing to undo."
 
-        steps = max(1, steps)
-        actual = min(steps, len(history))
-
-        for _ in range(actual):
-            snapshot = history.pop()
-            future.append({
-                "data_store": copy.deepcopy(self.context["data_store"]),
-                "user_knowledge": copy.deepcopy(
-                    self.context["memory"].export()
-                ),
-                "description": snapshot["description"]
-            })
-
-            self.context["data_store"] = snapshot["data_store"]
-            self.context["memory"].load(snapshot["user_knowledge"])
+        actual = history.undo(self.context, steps)
 
         self.context.pop("last_decision", None)
         return f"Undid {actual} action(s)."
 
     # ---------------- REDO ----------------
     def redo(self, steps=1):
-        future = self.context.get("future", [])
-        history = self.context.get("history", [])
+        history = self.context.get("history")
 
-        if not future:
+        if not history or not history.undone:
             return "There is nothing to redo."
 
-        steps = max(1, steps)
-        actual = min(steps, len(future))
-
-        for _ in range(actual):
-            snapshot = future.pop()
-            history.append({
-                "data_store": copy.deepcopy(self.context["data_store"]),
-                "user_knowledge": copy.deepcopy(
-                    self.context["memory"].export()
-                ),
-                "description": snapshot["description"]
-            })
-
-            self.context["data_store"] = snapshot["data_store"]
-            self.context["memory"].load(snapshot["user_knowledge"])
+        actual = history.redo(self.context, steps)
 
         self.context.pop("last_decision", None)
         return f"Redid {actual} action(s)."
@@ -0,0 +1,135 @@
+import sys
+from collections import deque
+
+
+MISSING = object()
+
+
+class History:
+    """
+    Undo / redo history stored as reversible per-key deltas.
+
+    Each step remembers, for every key it changed, the value the key held
+    before the change. Undoing swaps those values back in and keeps the
+    displaced ones, so the same step becomes the redo entry. Values are
+    shared rather than copied: datasets are replaced on assignment, never
+    edited in place, so an old reference stays valid.
+
+    The history is bounded by a number of steps and by an estimate of the
+    memory held by the deltas; the oldest steps are dropped first.
+    """
+
+    MAX_STEPS = 1000
+    MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, max_steps=None, max_bytes=None):
+        self.max_steps = History.MAX_STEPS if max_steps is None else max_steps
+        self.max_bytes = History.MAX_BYTES if max_bytes is None else max_bytes
+
+        self.done = deque()
+        self.undone = []
+        self.bytes = 0
+
+    # --------------------------------------------------
+    # RECORDING
+    # --------------------------------------------------
+    def record(self, context, description, keys):
+        """
+        Remember the current values of `keys` ((section, key) pairs)
+        before they are changed.
+        """
+        changes = [
+            (section, key, self._read(context, section, key))
+            for section, key in keys
+        ]
+        step = {
+            "description": description,
+            "changes": changes,
+            "bytes": sum(self._estimate(v) for _, _, v in changes),
+        }
+
+        for dropped in self.undone:
+            self.bytes -= dropped["bytes"]
+        self.undone.clear()
+
+        self.done.append(step)
+        self.bytes += step["bytes"]
+        self._trim()
+
+    def _trim(self):
+        while len(self.done) > 1 and (
+            len(self.done) > self.max_steps or self.bytes > self.max_bytes
+        ):
+            self.bytes -= self.done.popleft()["bytes"]
+
+    # --------------------------------------------------
+    # UNDO / REDO
+    # --------------------------------------------------
+    def undo(self, context, steps=1):
+        return self._move(context, self.done, self.undone, steps)
+
+    def redo(self, context, steps=1):
+        return self._move(context, self.undone, self.done, steps)
+
+    def _move(self, context, source, target, steps):
+        actual = min(max(1, steps), len(source))
+
+        for _ in range(actual):
+            step = source.pop()
+            swapped = []
+
+            # Restore in reverse so repeated keys end at their oldest value
+            for section, key, value in reversed(step["changes"]):
+                swapped.append((section, key, self._read(context, section, key)))
+                self._write(context, section, key, value)
+
+            swapped.reverse()
+            self.bytes -= step["bytes"]
+            step["changes"] = swapped
+            step["bytes"] = sum(self._estimate(v) for _, _, v in swapped)
+            self.bytes += step["bytes"]
+            target.append(step)
+
+        return actual
+
+    # --------------------------------------------------
+    # STATE ACCESS
+    # --------------------------------------------------
+    def _read(self, context, section, key):
+        if section == "data_store":
+            return context["data_store"].get(key, MISSING)
+
+        if section == "derived":
+            value = context["derived"].get(key)
+            return MISSING if value is None else value
+
+        value = context["memory"].get(key)
+        return MISSING if value is None else value
+
+    def _write(self, context, section, key, value):
+        if section == "data_store":
+            if value is MISSING:
+                context["data_store"].pop(key, None)
+            else:
+                context["data_store"][key] = value
+            return
+
+        if section == "derived":
+            if value is MISSING:
+                context["derived"].remove(key)
+            else:
+                context["derived"].set(key, value)
+            return
+
+        if value is MISSING:
+            context["memory"].forget(key)
+        else:
+            context["memory"].learn(key, value)
+
+    def _estimate(self, value):
+        if value is MISSING:
+            return 0
+        if isinstance(value, (list, tuple)):
+            # Boxed floats: one pointer slot plus the float object each
+            return sys.getsizeof(value) + 24 * len(value)
+        return sys.getsizeof(value)
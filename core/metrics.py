@@ -0,0 +1,199 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+
+# Histogram bucket upper bounds in seconds: 10 µs doubling up to ~84 s
+BOUNDS = tuple(1e-5 * 2 ** k for k in range(24))
+
+
+class Histogram:
+    """
+    Latency histogram with fixed logarithmic buckets.
+    Recording is one bisect and two additions; quantiles are estimated
+    as the upper bound of the bucket they fall in.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)   # last bucket: +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BOUNDS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                return BOUNDS[i] if i < len(BOUNDS) else float("inf")
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters and latency histograms, keyed by metric name and labels.
+
+    - mlang_requests_total{domain, outcome}
+    - mlang_request_seconds{domain}, end to end
+    - mlang_phase_seconds{phase, domain}, for routing, handle, snapshot,
+      persist and external_fetch
+
+    Cheap enough to stay on: a perf_counter pair, a dict lookup and a
+    bisect per observation, under one lock so server threads can share it.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------
+    # RECORDING
+    # --------------------------------------------------
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def phase(self, phase, **labels):
+        return self.timer("mlang_phase_seconds", phase=phase, **labels)
+
+    # --------------------------------------------------
+    # EXPORT
+    # --------------------------------------------------
+    def to_dict(self):
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": h.count,
+                    "sum": h.sum,
+                    "p50": h.quantile(0.5),
+                    "p95": h.quantile(0.95),
+                    "p99": h.quantile(0.99),
+                }
+                for (name, labels), h in sorted(self.histograms.items())
+            ]
+        return {
+            "uptime_seconds": time.time() - self.started,
+            "counters": counters,
+            "histograms": histograms,
+        }
+
+    def to_json(self, extra=None):
+        data = self.to_dict()
+        data.update(extra or {})
+        return json.dumps(data, indent=2)
+
+    def to_prometheus(self, gauges=()):
+        """
+        Prometheus text exposition format. `gauges` is a sequence of
+        (name, value) pairs appended after the collected metrics.
+        """
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_labels(labels)} {value}")
+
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, n in zip(BOUNDS, h.counts):
+                    cumulative += n
+                    le = labels + (("le", f"{bound:g}"),)
+                    lines.append(f"{name}_bucket{_labels(le)} {cumulative}")
+                le = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{_labels(le)} {h.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {h.sum:.9f}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+
+        for name, value in gauges:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """
+        Short human-readable view: requests and latency per domain and phase.
+        """
+        sections = {"mlang_request_seconds": [], "mlang_phase_seconds": []}
+
+        with self._lock:
+            total = sum(
+                value for (name, _), value in self.counters.items()
+                if name == "mlang_requests_total"
+            )
+            for (name, labels), h in sorted(self.histograms.items()):
+                if name not in sections:
+                    continue
+                labels = dict(labels)
+                title = labels.get("phase") or labels.get("domain", "-")
+                if "phase" in labels and "domain" in labels:
+                    title += f" ({labels['domain']})"
+                sections[name].append(
+                    f"  {title}: {h.count}, mean {_ms(h.sum / h.count)}, "
+                    f"p50 ≤{_ms(h.quantile(0.5))}, p95 ≤{_ms(h.quantile(0.95))}, "
+                    f"p99 ≤{_ms(h.quantile(0.99))}"
+                )
+
+        lines = [f"Requests: {total}"]
+        if sections["mlang_request_seconds"]:
+            lines += ["By domain:"] + sections["mlang_request_seconds"]
+        if sections["mlang_phase_seconds"]:
+            lines += ["By phase:"] + sections["mlang_phase_seconds"]
+        return "\n".join(lines)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _ms(seconds):
+    if seconds == float("inf"):
+        return "∞"
+    return f"{seconds * 1000:.3g} ms"
@@ -0,0 +1,132 @@
+from collections import deque, namedtuple
+
+from core.utterance import Utterance
+
+
+Route = namedtuple("Route", ["domain", "trigger"])
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class TriggerIndex:
+    """
+    Aho-Corasick automaton over the trigger phrases of a set of domains.
+
+    Built once; a single pass over the input finds every trigger, whatever
+    the number of domains. Phrases that start or end with a word character
+    only match on word boundaries, so "or" does not fire inside "for" and
+    "min" does not fire inside "minus". Symbolic triggers ("=", "∫") match
+    anywhere.
+    """
+
+    def __init__(self, domains):
+        self.domains = list(domains)
+        self.patterns = []          # (phrase, domain position, prefix only)
+
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for position, domain in enumerate(self.domains):
+            for phrase in domain.triggers:
+                self._add(phrase, position, False)
+            for phrase in domain.prefixes:
+                self._add(phrase, position, True)
+
+        self._link()
+
+    # --------------------------------------------------
+    # BUILD
+    # --------------------------------------------------
+    def _add(self, phrase, position, prefix):
+        phrase = phrase.lower()
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+
+        self._out[node].append(len(self.patterns))
+        self.patterns.append((phrase, position, prefix))
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+
+                self._fail[child] = target if target != child else 0
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    # --------------------------------------------------
+    # SEARCH
+    # --------------------------------------------------
+    def match(self, text):
+        """
+        Return {domain position: first matching trigger} for `text`.
+        """
+        found = {}
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for pattern in out[node]:
+                phrase, position, prefix = self.patterns[pattern]
+                if position in found:
+                    continue
+
+                start = end - len(phrase)
+                if prefix and start != 0:
+                    continue
+                if not self._bounded(text, start, end, phrase):
+                    continue
+
+                found[position] = phrase
+
+        return found
+
+    def _bounded(self, text, start, end, phrase):
+        if _is_word_char(phrase[0]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(phrase[-1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+
+class Router:
+    """
+    Picks candidate domains for an input, in registration (priority) order.
+    """
+
+    def __init__(self, domains):
+        self.domains = list(domains)
+        self.index = TriggerIndex(self.domains)
+
+    def route(self, context):
+        found = self.index.match(Utterance.of(context).text)
+
+        routes = []
+        for position, domain in enumerate(self.domains):
+            if domain.claims(context):
+                routes.append(Route(domain, None))
+            elif position in found:
+                routes.append(Route(domain, found[position]))
+        return routes
@@ -0,0 +1,378 @@
+import math
+import random
+import weakref
+from array import array
+from bisect import bisect_left
+from itertools import accumulate
+
+from core.dataset import Dataset
+from utils.optional import numpy as _np
+
+
+# Two-sided z-score for the 99% confidence that error bounds are quoted at
+Z_99 = 2.576
+
+_MASK64 = (1 << 64) - 1
+
+
+def _vector(dataset):
+    """
+    A zero-copy NumPy view of a large dataset, or None (see Dataset).
+    """
+    if len(dataset) < Dataset.VECTOR_MIN or not _np():
+        return None
+    return _np().frombuffer(dataset.values, dtype=_np().float64)
+
+
+class QuantileSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Values are kept in levels; a value at level h stands for 2**h of the
+    values seen. When the sketch outgrows its capacity, the lowest full
+    level is compacted: its sorted values are paired off, and one value
+    of each pair, chosen by a coin flip per compaction, moves up a
+    level. Capacities shrink by 2/3 per level below the top one, so the
+    sketch never holds more than about 3k values, and a quantile's rank
+    is off by at most `rank_error` (as a fraction of the count) with 99%
+    confidence.
+
+    A batch of values (a whole dataset, or values appended to it) is
+    sorted once and halved until it fits a level, instead of being fed in
+    value by value. A large batch is halved all the way to the top level,
+    so a sketch built from one dataset keeps fewer than k values (124 of
+    a million with the default k); appends fill the lower levels back up.
+    """
+
+    K = 200
+    MIN_WIDTH = 8
+    SHRINK = 2 / 3
+
+    def __init__(self, k=None, seed=None):
+        self.k = QuantileSketch.K if k is None else k
+        self.levels = [[]]          # level h: sorted values of weight 2**h
+        self.count = 0
+        self.min = self.max = None
+        self.compactions = 0
+        self._random = random.Random(seed)
+        self._cdf = None            # (values, cumulative weights), on first query
+
+    @property
+    def rank_error(self):
+        """
+        Normalized rank error at 99% confidence; 0 while nothing has been
+        compacted away. The constants are the empirical fit published
+        with the Apache DataSketches KLL implementation.
+        """
+        return 2.296 / self.k ** 0.9723 if self.compactions else 0.0
+
+    @property
+    def retained(self):
+        return sum(map(len, self.levels))
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(QuantileSketch.MIN_WIDTH, math.ceil(self.k * QuantileSketch.SHRINK ** depth))
+
+    # --------------------------------------------------
+    # UPDATE
+    # --------------------------------------------------
+    def update(self, dataset):
+        if not len(dataset):
+            return
+
+        vector = _vector(dataset)
+        batch = _np().sort(vector) if vector is not None else sorted(dataset.values)
+        self.count += len(batch)
+        low, high = float(batch[0]), float(batch[-1])
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+        level = 0
+        while len(batch) > self._capacity(level):
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+            if len(batch) % 2:
+                # An odd value out stays at this level, so no weight is lost
+                self.levels[level] = sorted(self.levels[level] + [float(batch[-1])])
+                batch = batch[:-1]
+            batch = batch[self._random.getrandbits(1)::2]
+            self.compactions += 1
+            level += 1
+
+        batch = batch.tolist() if vector is not None else batch
+        self.levels[level] = sorted(self.levels[level] + batch)
+        self._compress()
+        self._cdf = None
+
+    def _compress(self):
+        while self.retained > sum(map(self._capacity, range(len(self.levels)))):
+            level = next(
+                h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h)
+            )
+            if level + 1 == len(self.levels):
+                self.levels.append([])
+
+            items = self.levels[level]
+            kept, paired = (items[-1:], items[:-1]) if len(items) % 2 else ([], items)
+            promoted = paired[self._random.getrandbits(1)::2]
+            self.levels[level] = kept
+            self.levels[level + 1] = sorted(self.levels[level + 1] + promoted)
+            self.compactions += 1
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+    def quantile(self, q):
+        """
+        A value whose rank is about q * count (0 <= q <= 1).
+        """
+        if self.count == 0:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        if self._cdf is None:
+            weighted = sorted(
+                (value, 1 << level)
+                for level, items in enumerate(self.levels) for value in items
+            )
+            self._cdf = (
+                [value for value, _ in weighted],
+                list(accumulate(weight for _, weight in weighted)),
+            )
+
+        values, cumulative = self._cdf
+        i = bisect_left(cumulative, q * cumulative[-1])
+        return values[min(i, len(values) - 1)]
+
+    def bounds(self, q):
+        """
+        The values the true q-quantile lies between, at 99% confidence.
+        """
+        error = self.rank_error
+        return self.quantile(max(0.0, q - error)), self.quantile(min(1.0, q + error))
+
+
+class DistinctCounter:
+    """
+    HyperLogLog distinct counter (Flajolet et al., 2007) with 2**precision
+    one-byte registers.
+
+    Each value is hashed (splitmix64 of its bit pattern); the first
+    `precision` bits pick a register, which keeps the longest run of
+    leading zeros seen in the rest. The count is estimated from the
+    register histogram with Ertl's improved estimator (2017), which is
+    accurate from a handful of values up, without bias-correction tables.
+    The relative standard error is 1.04 / sqrt(2**precision).
+    """
+
+    PRECISION = 14
+
+    def __init__(self, precision=None):
+        self.precision = DistinctCounter.PRECISION if precision is None else precision
+        self.registers = bytearray(1 << self.precision)
+        self._estimate = None
+
+    @property
+    def standard_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    # --------------------------------------------------
+    # UPDATE
+    # --------------------------------------------------
+    def update(self, dataset):
+        if not len(dataset):
+            return
+        self._estimate = None
+        width = 64 - self.precision
+
+        vector = _vector(dataset)
+        if vector is not None:
+            np = _np()
+            uint = np.uint64
+            # + 0.0 turns -0.0 into 0.0, which is the same value
+            z = (vector + 0.0).view(uint)
+            z += uint(0x9E3779B97F4A7C15)
+            z ^= z >> uint(30)
+            z *= uint(0xBF58476D1CE4E5B9)
+            z ^= z >> uint(27)
+            z *= uint(0x94D049BB133111EB)
+            z ^= z >> uint(31)
+
+            index = (z >> uint(width)).astype(np.intp)
+            # The rest has fewer than 53 bits, so frexp gives its exact bit length
+            rest = (z & uint((1 << width) - 1)).astype(np.float64)
+            rank = (width + 1 - np.frexp(rest)[1]).astype(np.uint8)
+            np.maximum.at(np.frombuffer(self.registers, dtype=np.uint8), index, rank)
+            return
+
+        bits = array("Q")
+        bits.frombytes(array("d", [value + 0.0 for value in dataset.values]).tobytes())
+        registers, mask = self.registers, (1 << width) - 1
+        for z in bits:
+            z = (z + 0x9E3779B97F4A7C15) & _MASK64
+            z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+            z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+            z ^= z >> 31
+            index, rank = z >> width, width + 1 - (z & mask).bit_length()
+            if rank > registers[index]:
+                registers[index] = rank
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+    def estimate(self):
+        if self._estimate is None:
+            self._estimate = self._ertl()
+        return self._estimate
+
+    def bounds(self):
+        """
+        The range the true count lies in, at 99% confidence.
+        """
+        estimate, error = self.estimate(), Z_99 * self.standard_error
+        return max(0.0, estimate * (1 - error)), estimate * (1 + error)
+
+    def _ertl(self):
+        m, width = len(self.registers), 64 - self.precision
+        histogram = [0] * (width + 2)
+        for rank, registers in _histogram(self.registers):
+            histogram[rank] = registers
+        if histogram[0] == m:
+            return 0.0
+
+        z = m * _tau(1 - histogram[width + 1] / m)
+        for rank in range(width, 0, -1):
+            z = 0.5 * (z + histogram[rank])
+        z += m * _sigma(histogram[0] / m)
+        return m * m / (2 * math.log(2) * z)
+
+
+def _histogram(registers):
+    if _np():
+        counts = _np().bincount(_np().frombuffer(registers, dtype=_np().uint8))
+        return [(rank, int(n)) for rank, n in enumerate(counts) if n]
+    return [(rank, registers.count(rank)) for rank in set(registers)]
+
+
+def _sigma(x):
+    if x == 1:
+        return math.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous, z = z, z + x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x):
+    if x == 0 or x == 1:
+        return 0.0
+    y, z = 1.0, 1 - x
+    while True:
+        x = math.sqrt(x)
+        y *= 0.5
+        previous, z = z, z - (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+class DatasetSketch:
+    """
+    The quantile sketch and distinct counter of one dataset, and which
+    dataset they describe (held weakly, like the response cache does).
+    """
+
+    def __init__(self, dataset, k=None, precision=None):
+        self.k = k
+        self.precision = precision
+        self.rebuild(dataset)
+
+    def covers(self, dataset):
+        return self._covers() is dataset
+
+    def rebuild(self, dataset):
+        self.quantiles = QuantileSketch(self.k)
+        self.distinct = DistinctCounter(self.precision)
+        self.extend(dataset, dataset)
+
+    def extend(self, values, dataset):
+        """
+        Add `values`, appended to make `dataset`.
+        """
+        self.quantiles.update(values)
+        self.distinct.update(values)
+        self._covers = weakref.ref(dataset)
+
+
+class Sketches:
+    """
+    data_store entries in sketch mode, by name.
+
+    Which entries are in sketch mode is saved (see export); the sketches
+    themselves are not, and are built on first use. A sketch follows
+    appends to its dataset incrementally (see appended). Any other change
+    (assignment, load, undo, a merge from another process) replaces the
+    dataset; the sketch notices on its next use and is rebuilt from the
+    new values.
+    """
+
+    def __init__(self):
+        self._sketches = {}     # name -> DatasetSketch, or None until used
+
+    def __contains__(self, name):
+        return name in self._sketches
+
+    def load(self, names):
+        self._sketches = dict.fromkeys(names or (), None)
+
+    def export(self):
+        """
+        The entries in sketch mode, as the store's "sketches" section.
+        """
+        return dict.fromkeys(self._sketches, True)
+
+    def enable(self, name, dataset=None):
+        """
+        Put `name` in sketch mode. Its sketch is built now if `dataset` is
+        given, else on first use.
+        """
+        if self._sketches.get(name) is None:
+            self._sketches[name] = None if dataset is None else DatasetSketch(dataset)
+        return self.get(name, dataset) if dataset is not None else None
+
+    def disable(self, name):
+        if name not in self._sketches:
+            return False
+        del self._sketches[name]
+        return True
+
+    def get(self, name, dataset):
+        """
+        The up-to-date sketch of `dataset`, stored as `name`, or None if
+        the entry is not in sketch mode.
+        """
+        if name not in self._sketches:
+            return None
+        sketch = self._sketches[name]
+        if sketch is None:
+            sketch = self._sketches[name] = DatasetSketch(dataset)
+        elif not sketch.covers(dataset):
+            sketch.rebuild(dataset)
+        return sketch
+
+    def appended(self, name, before, after, values):
+        """
+        Add appended values to the sketch, if it is built and up to date.
+        True if it was extended; otherwise it is built from `after` on use.
+        """
+        sketch = self._sketches.get(name)
+        if sketch is None or not sketch.covers(before):
+            return False
+        sketch.extend(values, after)
+        return True
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from core.utterance import Utterance
+
 
 class State(ABC):
     @abstractmethod
@@ -10,6 +12,8 @@ class State(ABC):
 class S0Ready(State):
     def handle(self, engine, user_input):
         engine.context["raw_input"] = user_input
+        # Parsed once here; every domain reads the same Utterance
+        engine.context["utterance"] = Utterance(user_input, engine.context.get("data_store"))
         return engine.execute()   # 🔥 DIRECTLY EXECUTE APPLICATION LOGIC
 
 
@@ -0,0 +1,128 @@
+import re
+
+
+# Longest first, so ">=" is not read as ">"
+COMPARATORS = re.compile(r">=|<=|==|>|<")
+
+# Only tokens starting like a number are tried as one
+NUMBER_START = frozenset("0123456789.-+")
+
+
+class Utterance:
+    """
+    One input, parsed once and shared by every domain.
+
+    `text` is the stripped, lowercased input and `compact` the same without
+    spaces. `tokens` split it on whitespace, commas and "=" ("x=1,2" reads
+    as x, 1, 2); `numbers` are the tokens that read as numbers; `refs` the
+    tokens naming a stored dataset. `comparators` lists (symbol, text after
+    it) in order of appearance.
+
+    Each part is worked out the first time a domain asks for it and kept,
+    so an input that only needs `text` pays for nothing else. All parts
+    are read-only properties. Use Utterance.of(context) to get the one for the
+    current input: it is parsed again only if raw_input has changed (e.g.
+    a domain rewrote it).
+    """
+
+    __slots__ = (
+        "_raw", "_text", "_data_store",
+        "_compact", "_tokens", "_numbers", "_refs", "_comparators"
+    )
+
+    def __init__(self, raw, data_store=None):
+        self._raw = raw
+        self._text = raw.strip().lower()
+        self._data_store = data_store
+        self._compact = self._tokens = self._numbers = None
+        self._refs = self._comparators = None
+
+    @classmethod
+    def of(cls, context):
+        raw = context.get("raw_input", "")
+        utterance = context.get("utterance")
+        if utterance is None or utterance.raw != raw:
+            utterance = context["utterance"] = cls(raw, context.get("data_store"))
+        return utterance
+
+    def __repr__(self):
+        return f"Utterance({self._raw!r})"
+
+    # --------------------------------------------------
+    # PARTS
+    # --------------------------------------------------
+    @property
+    def raw(self):
+        return self._raw
+
+    @property
+    def text(self):
+        return self._text
+
+    @property
+    def compact(self):
+        if self._compact is None:
+            self._compact = self._text.replace(" ", "")
+        return self._compact
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = tuple(_split(self._text))
+        return self._tokens
+
+    @property
+    def numbers(self):
+        if self._numbers is None:
+            self._numbers = _numbers(self.tokens)
+        return self._numbers
+
+    @property
+    def refs(self):
+        if self._refs is None:
+            data_store = self._data_store
+            self._refs = tuple(
+                [t for t in dict.fromkeys(self.tokens) if t in data_store]
+            ) if data_store else ()
+        return self._refs
+
+    @property
+    def comparators(self):
+        if self._comparators is None:
+            text = self._text
+            self._comparators = tuple(
+                [(m[0], text[m.end():].strip()) for m in COMPARATORS.finditer(text)]
+            ) if "<" in text or ">" in text or "==" in text else ()
+        return self._comparators
+
+    # --------------------------------------------------
+    # QUERIES
+    # --------------------------------------------------
+    def after(self, word):
+        """
+        Text following the first " `word` " (e.g. a preposition), or None
+        if the word does not occur.
+        """
+        at = self._text.find(f" {word} ")
+        return None if at < 0 else self._text[at + len(word) + 2:]
+
+    def numbers_after(self, offset):
+        """
+        Numbers that appear after character `offset` of `text`.
+        """
+        return _numbers(_split(self._text[offset + 1:]))
+
+
+def _split(text):
+    return text.replace(",", " ").replace("=", " ").split()
+
+
+def _numbers(tokens):
+    numbers = []
+    for token in tokens:
+        if token[0] in NUMBER_START:
+            try:
+                numbers.append(float(token))
+            except ValueError:
+                pass
+    return tuple(numbers)
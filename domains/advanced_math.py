@@ -1,28 +1,146 @@
+from core.utterance import Utterance
 from domains.base import Domain, DomainResponse
-import sympy as sp
+from utils.expression import normalize
+from collections import OrderedDict
+import json
+import logging
+import os
+import re
+import threading
+
+log = logging.getLogger(__name__)
+
+
+class LimitCache:
+    """
+    LRU cache of symbolic limit results.
+
+    Keys are the canonical (sympy srepr) form of the expression, plus the
+    variable and the point, so reordered or re-spaced inputs share an entry.
+    When a path is given, entries survive across runs in a small JSON file,
+    rewritten after every `SAVE_EVERY` new results and on close. One cache
+    may be shared by several sessions (see interface/server.py), and
+    several processes may share the file: each writes its own temporary
+    file and renames it into place, so the last complete write wins.
+    """
+
+    FILE = "mlang_limits.json"
+    MAX_ENTRIES = 256
+    SAVE_EVERY = 16
+
+    def __init__(self, path=None, max_entries=None):
+        self.path = path
+        self.max_entries = (
+            LimitCache.MAX_ENTRIES if max_entries is None else max_entries
+        )
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._unsaved = 0
+        self._lock = threading.Lock()
+
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries.update(json.load(f))
+            except (OSError, ValueError):
+                self.entries.clear()
+
+    def get(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self.entries[key] = result
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self._unsaved += 1
+            if self._unsaved >= LimitCache.SAVE_EVERY:
+                self._save()
+
+    def close(self):
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _save(self):
+        self._unsaved = 0
+        if not self.path:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp, self.path)
+        except OSError as exc:
+            # The next save writes every entry again
+            log.warning("could not save limit cache to %s: %s", self.path, exc)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
 
 
 class AdvancedMathDomain(Domain):
     name = "ADVANCED_MATH"
+    triggers = ("limit",)
 
-    def can_handle(self, context):
-        return "limit" in context["raw_input"].lower()
+    def __init__(self, cache=None):
+        # Kept in memory unless the caller gives a cache with a file
+        self.cache = cache if cache is not None else LimitCache()
 
     def handle(self, context):
-        x = sp.symbols("x")
-        text = context["raw_input"].lower()
+        text = Utterance.of(context).text
+
+        # ---------- Operator view of the cache ----------
+        if re.fullmatch(r"\s*limit (cache|stats)\s*", text):
+            s = self.cache.stats()
+            return DomainResponse(
+                True,
+                f"Limit cache: {s['entries']} entries, "
+                f"{s['hits']} hits, {s['misses']} misses."
+            )
+
+        import sympy as sp  # deferred: heavy, and only needed for limits
+
+        body = re.sub(r"^\s*(of|the)\s+", "", text.split("limit", 1)[1])
+        m = re.fullmatch(r"\s*(.+?)\s+as\s+([a-z]\w*)?\s*->\s*(.+?)\s*", body)
+        if not m:
+            return DomainResponse(True, needs_clarification=True)
+        expr_text, var_text, point_text = m.groups()
 
         try:
-            expr = sp.sympify(text.split("limit")[1].split("as")[0])
-            point = float(text.split("->")[1])
-            result = sp.limit(expr, x, point)
+            x = sp.symbols(var_text or "x")
+            expr = sp.sympify(normalize(expr_text))
+            point = float(point_text)
+
+            key = f"{sp.srepr(expr)}|{x}|{point!r}"
+            result = self.cache.get(key)
+            cached = result is not None
+            if not cached:
+                result = str(sp.limit(expr, x, point))
+                self.cache.put(key, result)
+
+            reason = (
+                "I evaluated the limit using standard limit rules\n"
+                "and symbolic simplification."
+            )
+            if cached:
+                reason += "\nI reused the result I computed earlier for this limit."
 
             context["last_decision"] = {
                 "type": "advanced_math",
-                "reason": (
-                    "I evaluated the limit using standard limit rules\n"
-                    "and symbolic simplification."
-                )
+                "reason": reason
             }
             return DomainResponse(True, f"The limit is {result}.")
         except Exception:
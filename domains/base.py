@@ -5,6 +5,9 @@
 
 from abc import ABC, abstractmethod
 
+from core.router import TriggerIndex
+from core.utterance import Utterance
+
 
 class DomainResponse:
     """
@@ -24,12 +27,36 @@ class Domain(ABC):
 
     name = "BASE_DOMAIN"
 
-    @abstractmethod
+    # Phrases that route an input to this domain (see core/router.py).
+    triggers = ()
+
+    # Phrases that only count at the very start of the input.
+    prefixes = ()
+
+    # The response depends only on the input, the datasets it names and
+    # (if reads_memory) Memory, and handling changes nothing: it may be
+    # served from the response cache (see core/cache.py).
+    deterministic = False
+    reads_memory = False
+
+    def claims(self, context):
+        """
+        Take the request regardless of triggers (e.g. a pending follow-up).
+        """
+        return False
+
     def can_handle(self, context):
         """
         Decide if this domain can handle the request.
         """
-        pass
+        if self.claims(context):
+            return True
+
+        index = self.__dict__.get("_trigger_index")
+        if index is None:
+            index = self._trigger_index = TriggerIndex([self])
+
+        return bool(index.match(Utterance.of(context).text))
 
     @abstractmethod
     def handle(self, context):
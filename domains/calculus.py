@@ -1,26 +1,28 @@
+from core.utterance import Utterance
 from domains.base import Domain, DomainResponse
+from utils.expression import compile_expression, ExpressionError
+from utils.quadrature import DivergentIntegral, integrate, ORDER
 import re
 
 
 class CalculusDomain(Domain):
     name = "CALCULUS"
-
-    # --------------------------------------------------
-    def can_handle(self, context):
-        text = context["raw_input"].lower()
-        return any(t in text for t in [
-            "integral of",
-            "area under",
-            "definite integral",
-            "∫",
-            "derivative",
-            "rate of change",
-        ])
+    deterministic = True
+    triggers = (
+        "integral of",
+        "area under",
+        "definite integral",
+        "∫",
+        "derivative",
+        "rate of change",
+    )
+
+    # Target accuracy of numeric integration (relative above magnitude 1)
+    TOLERANCE = 1e-10
 
     # --------------------------------------------------
     def handle(self, context):
-        raw = context["raw_input"].strip()
-        text = raw.lower().replace(" ", "")
+        text = Utterance.of(context).compact
 
         # ==================================================
         # SYMBOLIC INDEFINITE INTEGRAL: ∫ f(x) dx
@@ -29,19 +31,11 @@ class CalculusDomain(Domain):
             func = text[1:-2]
             return self._indefinite_integral(func, context)
 
-        # ==================================================
-        # NATURAL LANGUAGE INDEFINITE INTEGRAL
-        # ==================================================
-        m = re.fullmatch(r"integralof(.+)", text)
-        if m:
-            func = m.group(1)
-            return self._indefinite_integral(func, context)
-
         # ==================================================
         # DEFINITE INTEGRAL
         # ==================================================
         m = re.search(
-            r"(areaunder|integralof|definiteintegralof)(.+)from(\d+\.?\d*)to(\d+\.?\d*)",
+            r"(areaunder|integralof|definiteintegralof)(.+)from(-?\d+\.?\d*)to(-?\d+\.?\d*)",
             text
         )
         if m:
@@ -50,6 +44,14 @@ class CalculusDomain(Domain):
             b = float(m.group(4))
             return self._definite_integral(func, a, b, context)
 
+        # ==================================================
+        # NATURAL LANGUAGE INDEFINITE INTEGRAL
+        # ==================================================
+        m = re.fullmatch(r"integralof(.+)", text)
+        if m:
+            func = m.group(1)
+            return self._indefinite_integral(func, context)
+
         return DomainResponse(True, needs_clarification=True)
 
     # ==================================================
@@ -91,7 +93,7 @@ class CalculusDomain(Domain):
     def _definite_integral(self, func, a, b, context):
         terms = self._parse_terms(func)
         if not terms:
-            return DomainResponse(True, needs_clarification=True)
+            return self._numeric_integral(func, a, b, context)
 
         explanation = [
             "This is a definite integral.",
@@ -122,6 +124,68 @@ class CalculusDomain(Domain):
             f"The definite integral is {area}."
         )
 
+    # ==================================================
+    # NUMERIC DEFINITE INTEGRAL
+    # ==================================================
+    def _numeric_integral(self, func, a, b, context):
+        try:
+            expr = compile_expression(func)
+        except ExpressionError:
+            return DomainResponse(True, needs_clarification=True)
+
+        if len(expr.variables) > 1:
+            return DomainResponse(True, needs_clarification=True)
+        var = expr.variables[0] if expr.variables else "x"
+
+        try:
+            result = integrate(expr.vectorized(var), a, b, tol=self.TOLERANCE)
+        except DivergentIntegral as exc:
+            context["last_decision"] = {
+                "type": "calculus",
+                "reason": (
+                    f"Near {var} = {exc.point:.6g} the pieces of the integral stopped "
+                    "shrinking as I narrowed the interval, so the area there is unbounded."
+                )
+            }
+            return DomainResponse(
+                True, f"This integral diverges near {var} = {exc.point:.6g}; it has no finite value."
+            )
+        except (ArithmeticError, TypeError, ValueError):
+            return DomainResponse(True, needs_clarification=True)
+
+        area = float(f"{result.value:.12g}")
+
+        explanation = [
+            "This is a definite integral.",
+            f"{expr.source} has no power-rule antiderivative I can use,",
+            "so I integrated it numerically with adaptive Gauss–Legendre quadrature.",
+            f"I split [{a}, {b}] into {result.panels} intervals, each checked against "
+            f"its two halves with a {ORDER}-point rule ({result.evaluations} evaluations).",
+            f"The estimated error is {result.error:.2g}, "
+            + (
+                f"within the tolerance of {self.TOLERANCE:g}."
+                if result.converged else
+                f"which does NOT meet the tolerance of {self.TOLERANCE:g}."
+            ),
+        ]
+
+        context["last_decision"] = {
+            "type": "calculus",
+            "reason": "\n".join(explanation)
+        }
+
+        if not result.converged:
+            return DomainResponse(
+                True,
+                f"The definite integral is roughly {area}, but the estimate did not "
+                f"converge (error about {result.error:.2g})."
+            )
+
+        return DomainResponse(
+            True,
+            f"The definite integral is approximately {area}."
+        )
+
     # ==================================================
     # TERM PARSER
     # ==================================================
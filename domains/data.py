@@ -1,47 +1,93 @@
+import re
+
 from domains.base import Domain, DomainResponse
+from core.dataset import Dataset
+from core.derived import DerivedError, parse_formula
+from core.sketch import Z_99, DatasetSketch
+from core.utterance import Utterance
+
+
+# "median of marks", "the 90th percentile of marks", "mode of ids"
+_STATISTIC = re.compile(
+    r"\b(?:(mean|average|sum|total|median|mode|variance|standard deviation|stddev)"
+    r"|(\d+(?:\.\d+)?)(?:st|nd|rd|th)? percentile) of "
+)
+
+# Answered from a sketch (see core/sketch.py); nothing may follow the name,
+# since a sketch can't be filtered
+_SKETCH_QUANTILE = re.compile(
+    r"(?:(median)|(\d+(?:\.\d+)?)(?:st|nd|rd|th)? percentile) of ([a-z_]\w*)$"
+)
+_DISTINCT = re.compile(r"distinct values? (?:are there )?(?:in|of) ([a-z_]\w*)$")
+_APPROXIMATELY = re.compile(r"\b(?:approximately|approximate|approx|roughly)\b")
+
+_STATISTIC_METHODS = {
+    "mean": "mean", "average": "mean",
+    "sum": "sum", "total": "sum",
+    "median": "median", "mode": "mode", "variance": "variance",
+    "standard deviation": "stddev", "stddev": "stddev",
+}
 
 
 class DataDomain(Domain):
     name = "DATA"
-
-    def can_handle(self, context):
-        raw = context["raw_input"].lower()
-        return any(k in raw for k in [
-            "find", "minimum", "maximum", "min", "max",
-            "best", "sort",
-            "where", "and", "or",
-            "above", "below", "near", "around",
-            "closest", "nearest",
-            "highest", "lowest"
-        ])
+    deterministic = True
+    triggers = (
+        "find", "minimum", "maximum", "min", "max",
+        "best", "sort",
+        "where", "and", "or",
+        "above", "below", "near", "around",
+        "closest", "nearest",
+        "highest", "lowest",
+        "mean of", "average of", "sum of", "total of",
+        "median of", "percentile of", "mode of",
+        "variance of", "standard deviation of", "stddev of",
+        "distinct", "approximately", "approximate", "roughly"
+    )
+    prefixes = ("dot of", "dot product of")
 
     def handle(self, context):
-        raw = context["raw_input"].lower()
+        utterance = Utterance.of(context)
+        raw = utterance.text
+
+        # -------- DOT PRODUCT --------
+        if raw.startswith("dot"):
+            return self._dot(raw, context)
+
+        # -------- SKETCHES, DISTINCT COUNTS --------
+        if "percentile of" in raw or "median of" in raw or "distinct" in raw:
+            response = self._approximate(raw, context)
+            if response is not None:
+                return response
 
         # -------- COMPOUND PHRASES (TOP PRIORITY) --------
         if "highest below" in raw:
-            return self._highest_below(raw, context)
+            return self._highest_below(utterance, context)
 
         if "lowest above" in raw:
-            return self._lowest_above(raw, context)
+            return self._lowest_above(utterance, context)
 
         if "closest above" in raw:
-            return self._closest_above(raw, context)
+            return self._closest_above(utterance, context)
 
         if "closest below" in raw:
-            return self._closest_below(raw, context)
+            return self._closest_below(utterance, context)
 
         # -------- CLOSEST / NEAREST --------
         if "closest" in raw or "nearest" in raw:
-            return self._handle_closest(raw, context)
+            return self._handle_closest(utterance, context)
 
         # -------- NORMAL EXTRACTION + FILTERING --------
-        numbers, reason = self._extract_and_filter(raw, context)
+        numbers, reason = self._extract_and_filter(utterance, context)
         if not numbers:
             return DomainResponse(True, needs_clarification=True)
 
+        statistic = _STATISTIC.search(raw)
+        if statistic:
+            return self._statistic(statistic, numbers, reason, context)
+
         if "minimum" in raw or "min" in raw:
-            result = min(numbers)
+            result = numbers.min()
             context["last_decision"] = {
                 "type": "data",
                 "reason": f"After filtering, the smallest value in {numbers} is {result}. {reason}"
@@ -49,7 +95,7 @@ class DataDomain(Domain):
             return DomainResponse(True, f"The minimum value is {result}.")
 
         if "maximum" in raw or "max" in raw:
-            result = max(numbers)
+            result = numbers.max()
             context["last_decision"] = {
                 "type": "data",
                 "reason": f"After filtering, the largest value in {numbers} is {result}. {reason}"
@@ -57,7 +103,7 @@ class DataDomain(Domain):
             return DomainResponse(True, f"The maximum value is {result}.")
 
         if "best" in raw:
-            result = max(numbers)
+            result = numbers.max()
             context["last_decision"] = {
                 "type": "data",
                 "reason": f"After filtering, {result} is the highest value in {numbers}. {reason}"
@@ -65,7 +111,7 @@ class DataDomain(Domain):
             return DomainResponse(True, f"The best value is {result}.")
 
         if "sort" in raw:
-            sorted_vals = sorted(numbers)
+            sorted_vals = numbers.sorted()
             context["last_decision"] = {
                 "type": "data",
                 "reason": f"I sorted the values {numbers}."
@@ -77,141 +123,293 @@ class DataDomain(Domain):
     # ==================================================
     # COMPOUND PHRASES
     # ==================================================
-    def _highest_below(self, text, context):
-        numbers, target = self._resolve_compound(text, context, "below")
+    def _highest_below(self, utterance, context):
+        numbers, target = self._resolve_compound(utterance, context, "below")
         if target is None:
             return DomainResponse(True, needs_clarification=True)
 
-        candidates = [v for v in numbers if v < target]
-        if not candidates:
+        result = numbers.highest_below(target)
+        if result is None:
             return DomainResponse(True, needs_clarification=True)
 
-        result = max(candidates)
         context["last_decision"] = {
             "type": "data",
             "reason": f"I selected the highest value below {target} from {numbers}."
         }
         return DomainResponse(True, f"The highest value below {target} is {result}.")
 
-    def _lowest_above(self, text, context):
-        numbers, target = self._resolve_compound(text, context, "above")
+    def _lowest_above(self, utterance, context):
+        numbers, target = self._resolve_compound(utterance, context, "above")
         if target is None:
             return DomainResponse(True, needs_clarification=True)
 
-        candidates = [v for v in numbers if v > target]
-        if not candidates:
+        result = numbers.lowest_above(target)
+        if result is None:
             return DomainResponse(True, needs_clarification=True)
 
-        result = min(candidates)
         context["last_decision"] = {
             "type": "data",
             "reason": f"I selected the lowest value above {target} from {numbers}."
         }
         return DomainResponse(True, f"The lowest value above {target} is {result}.")
 
-    def _closest_above(self, text, context):
-        numbers, target = self._resolve_compound(text, context, "above")
+    def _closest_above(self, utterance, context):
+        numbers, target = self._resolve_compound(utterance, context, "above")
         if target is None:
             return DomainResponse(True, needs_clarification=True)
 
-        candidates = [v for v in numbers if v > target]
-        if not candidates:
+        result = numbers.lowest_above(target)
+        if result is None:
             return DomainResponse(True, needs_clarification=True)
 
-        result = min(candidates, key=lambda v: v - target)
         context["last_decision"] = {
             "type": "data",
             "reason": f"I chose the value just above {target}."
         }
         return DomainResponse(True, f"The closest value above {target} is {result}.")
 
-    def _closest_below(self, text, context):
-        numbers, target = self._resolve_compound(text, context, "below")
+    def _closest_below(self, utterance, context):
+        numbers, target = self._resolve_compound(utterance, context, "below")
         if target is None:
             return DomainResponse(True, needs_clarification=True)
 
-        candidates = [v for v in numbers if v < target]
-        if not candidates:
+        result = numbers.highest_below(target)
+        if result is None:
             return DomainResponse(True, needs_clarification=True)
 
-        result = max(candidates, key=lambda v: target - v)
         context["last_decision"] = {
             "type": "data",
             "reason": f"I chose the value just below {target}."
         }
         return DomainResponse(True, f"The closest value below {target} is {result}.")
 
+    def _dot(self, text, context):
+        data_store = context.get("data_store", {})
+        formula = parse_formula(text)
+        if formula is None or formula.op != "dot":
+            return DomainResponse(True, needs_clarification=True)
+
+        a, b = formula.sources
+        if a not in data_store or b not in data_store:
+            return DomainResponse(True, needs_clarification=True)
+
+        try:
+            result = formula.evaluate(data_store)[0]
+        except DerivedError as exc:
+            return DomainResponse(True, f"I can't take that dot product: {exc}.")
+
+        context["last_decision"] = {
+            "type": "data",
+            "reason": (
+                f"I multiplied each value of {a} by the matching value of {b} "
+                f"and added the {len(data_store[a])} products."
+            )
+        }
+        return DomainResponse(True, f"The dot product of {a} and {b} is {result}.")
+
+    # ==================================================
+    # STATISTICS
+    # ==================================================
+    def _statistic(self, match, numbers, reason, context):
+        name, percent = match.groups()
+        label = match.group(0)[:-len(" of ")]
+        n = len(numbers)
+
+        if percent is not None:
+            p = float(percent)
+            if p > 100:
+                return DomainResponse(True, needs_clarification=True)
+            result = numbers.percentile(p)
+            why = (
+                f"{result} lies {p:g}% of the way through the {n} values in "
+                f"sorted order, interpolating between the two nearest values."
+            )
+            message = f"The {label} is {result}."
+
+        elif _STATISTIC_METHODS[name] == "mode":
+            result, count = numbers.mode()
+            if count == 1 and n > 1:
+                why = f"I counted each of the {n} values; none occurs twice."
+                message = "No value occurs more than once, so there is no mode."
+            else:
+                why = (
+                    f"{result} occurs {count} times, more often than any other "
+                    f"value (ties go to the smaller value)."
+                )
+                message = f"The mode is {result} ({count} times)."
+
+        else:
+            method = _STATISTIC_METHODS[name]
+            result = getattr(numbers, method)()
+            why = {
+                "mean": f"I added the {n} values and divided by {n}.",
+                "sum": f"I added the {n} values.",
+                "median": f"Half of the {n} values are at or below {result} and half at or above it.",
+                "variance": (
+                    f"I summed the squared deviations of the {n} values from their "
+                    f"mean in a single pass and divided by one less than the count."
+                ),
+                "stddev": (
+                    f"It is the square root of the variance of the {n} values "
+                    f"(squared deviations from the mean, divided by one less than the count)."
+                ),
+            }[method]
+            message = f"The {label} is {result}."
+
+        context["last_decision"] = {
+            "type": "data",
+            "reason": f"{why} {reason}"
+        }
+        return DomainResponse(True, message)
+
+    # ==================================================
+    # SKETCHES
+    # ==================================================
+    def _approximate(self, raw, context):
+        """
+        Percentiles and distinct counts of an entry in sketch mode, or of
+        any entry when asked for "approximately" (answered from a sketch
+        built for that question only; the entry stays exact). Distinct
+        counts of other entries are exact. None if the question is left to
+        the exact statistics.
+        """
+        quantile = _SKETCH_QUANTILE.search(raw)
+        distinct = None if quantile else _DISTINCT.search(raw)
+        if not quantile and not distinct:
+            return None
+
+        name = (quantile or distinct).groups()[-1]
+        dataset = context.get("data_store", {}).get(name)
+        if not dataset:
+            return DomainResponse(True, needs_clarification=True)
+
+        sketches = context.get("sketches")
+        sketch = sketches.get(name, dataset) if sketches is not None else None
+        source = f"'{name}' is in sketch mode"
+        if sketch is None and _APPROXIMATELY.search(raw):
+            sketch = DatasetSketch(dataset)
+            source = f"You asked for an approximation, so I sketched '{name}' for this answer only"
+
+        if quantile:
+            return None if sketch is None else self._sketch_quantile(quantile, name, sketch, source, context)
+        return self._distinct(name, dataset, sketch, source, context)
+
+    def _sketch_quantile(self, match, name, sketch, source, context):
+        median, percent, _ = match.groups()
+        p = 50.0 if median else float(percent)
+        if p > 100:
+            return DomainResponse(True, needs_clarification=True)
+
+        label = "median" if median else match.group(0).rsplit(" of ", 1)[0]
+        quantiles = sketch.quantiles
+        if not quantiles.rank_error:
+            # Nothing compacted yet: the sketch is the data
+            result = context["data_store"][name].percentile(p)
+            context["last_decision"] = {
+                "type": "data",
+                "reason": (
+                    f"'{name}' is small enough that its sketch still holds all "
+                    f"{quantiles.count} values, so this is exact."
+                )
+            }
+            return DomainResponse(True, f"The {label} of {name} is {result}.")
+
+        result = quantiles.quantile(p / 100)
+        low, high = quantiles.bounds(p / 100)
+        context["last_decision"] = {
+            "type": "data",
+            "reason": (
+                f"This is approximate. {source}: a KLL sketch keeps "
+                f"{quantiles.retained} of its {quantiles.count} values, and the rank of "
+                f"{result} is within ±{quantiles.rank_error:.2%} of the {label}'s with 99% "
+                f"confidence, so the exact {label} lies between {low} and {high}."
+            )
+        }
+        return DomainResponse(True, f"The {label} of {name} is approximately {result}.")
+
+    def _distinct(self, name, dataset, sketch, source, context):
+        if sketch is None:
+            count = dataset.distinct()
+            context["last_decision"] = {
+                "type": "data",
+                "reason": f"I counted the different values among the {len(dataset)} in {name} exactly."
+            }
+            return DomainResponse(
+                True, f"{name} has {count} distinct value{'' if count == 1 else 's'}."
+            )
+
+        distinct, n = sketch.distinct, len(dataset)
+        count = min(n, max(1, round(distinct.estimate())))
+        low, high = (min(n, max(1, round(b))) for b in distinct.bounds())
+        context["last_decision"] = {
+            "type": "data",
+            "reason": (
+                f"This is approximate. {source}: a HyperLogLog counter "
+                f"with {len(distinct.registers)} registers estimated the count. Its standard "
+                f"error is {distinct.standard_error:.2%}, so with 99% confidence the exact "
+                f"count is within ±{Z_99 * distinct.standard_error:.1%}: between {low} and {high}."
+            )
+        }
+        return DomainResponse(True, f"{name} has about {count} distinct values.")
+
     # ==================================================
     # GENERIC EXTRACTION + FILTERING
     # ==================================================
-    def _extract_and_filter(self, text, context):
+    def _extract_and_filter(self, utterance, context):
         data_store = context.get("data_store", {})
-        numbers = []
+        numbers = Dataset()
         reason = "No filtering was applied."
 
         # Base extraction
-        if " of " in text:
-            name = text.split(" of ", 1)[1].split()[0]
-            numbers = data_store.get(name, [])
-        elif " in " in text:
-            name = text.split(" in ", 1)[1].split()[0]
-            numbers = data_store.get(name, [])
+        source = utterance.after("of")
+        if source is None:
+            source = utterance.after("in")
+        if source is not None:
+            numbers = data_store.get(_first_word(source), numbers)
         else:
-            for t in text.replace(",", " ").split():
-                try:
-                    numbers.append(float(t))
-                except ValueError:
-                    continue
+            numbers = Dataset(utterance.numbers)
 
         # Symbolic where
-        if " where " in text:
-            condition = text.split(" where ", 1)[1].strip()
-            numbers, reason = self._apply_condition(numbers, condition, context)
+        if utterance.after("where") is not None:
+            numbers, reason = self._apply_condition(numbers, utterance, context)
 
         # Natural comparatives
-        if " above " in text:
-            rhs = self._resolve_rhs(text.split(" above ", 1)[1], context)
-            numbers = [v for v in numbers if v > rhs]
+        above = utterance.after("above")
+        if above is not None:
+            rhs = self._resolve_rhs(above, context)
+            numbers = numbers.where(">", rhs)
             reason = f"I kept values above {rhs}."
 
-        if " below " in text:
-            rhs = self._resolve_rhs(text.split(" below ", 1)[1], context)
-            numbers = [v for v in numbers if v < rhs]
+        below = utterance.after("below")
+        if below is not None:
+            rhs = self._resolve_rhs(below, context)
+            numbers = numbers.where("<", rhs)
             reason = f"I kept values below {rhs}."
 
         return numbers, reason
 
-    def _apply_condition(self, numbers, condition, context):
-        data_store = context.get("data_store", {})
-        for op in [">=", "<=", ">", "<", "=="]:
-            if op in condition:
-                rhs = self._resolve_rhs(condition.split(op, 1)[1].strip(), context)
-                if rhs is None:
-                    return numbers, "Condition could not be resolved."
-                if op == ">":
-                    return [v for v in numbers if v > rhs], f"I kept values > {rhs}."
-                if op == "<":
-                    return [v for v in numbers if v < rhs], f"I kept values < {rhs}."
-                if op == ">=":
-                    return [v for v in numbers if v >= rhs], f"I kept values ≥ {rhs}."
-                if op == "<=":
-                    return [v for v in numbers if v <= rhs], f"I kept values ≤ {rhs}."
-                if op == "==":
-                    return [v for v in numbers if v == rhs], f"I kept values == {rhs}."
-        return numbers, "No valid condition was applied."
-
-    def _resolve_compound(self, text, context, word):
+    def _apply_condition(self, numbers, utterance, context):
+        if not utterance.comparators:
+            return numbers, "No valid condition was applied."
+
+        op, rest = utterance.comparators[0]
+        rhs = self._resolve_rhs(rest, context)
+        if rhs is None:
+            return numbers, "Condition could not be resolved."
+        symbol = {">=": "≥", "<=": "≤"}.get(op, op)
+        return numbers.where(op, rhs), f"I kept values {symbol} {rhs}."
+
+    def _resolve_compound(self, utterance, context, word):
         data_store = context.get("data_store", {})
-        numbers = []
+        numbers = Dataset()
 
-        if " of " in text:
-            dataset = text.split(" of ", 1)[1].strip()
-            numbers = data_store.get(dataset, [])
-        elif " in " in text:
-            dataset = text.split(" in ", 1)[1].strip()
-            numbers = data_store.get(dataset, [])
+        source = utterance.after("of")
+        if source is None:
+            source = utterance.after("in")
+        if source is not None:
+            numbers = data_store.get(source.strip(), numbers)
 
-        target_part = text.split(word, 1)[1]
+        target_part = utterance.after(word) or ""
         for stop in [" of ", " in "]:
             if stop in target_part:
                 target_part = target_part.split(stop, 1)[0]
@@ -227,19 +425,19 @@ class DataDomain(Domain):
 
         return numbers, target
 
-    def _handle_closest(self, text, context):
+    def _handle_closest(self, utterance, context):
         data_store = context.get("data_store", {})
-        if " to " not in text or " in " not in text:
+        target_part, dataset = utterance.after("to"), utterance.after("in")
+        if target_part is None or dataset is None:
             return DomainResponse(True, needs_clarification=True)
 
-        target_part, dataset = text.split(" to ", 1)[1].split(" in ", 1)
-        numbers = data_store.get(dataset.strip(), [])
-        target = self._resolve_rhs(target_part.strip(), context)
+        numbers = data_store.get(dataset.strip(), Dataset())
+        target = self._resolve_rhs(target_part, context)
 
         if target is None or not numbers:
             return DomainResponse(True, needs_clarification=True)
 
-        closest = min(numbers, key=lambda v: (abs(v - target), v))
+        closest = numbers.closest(target)
         context["last_decision"] = {
             "type": "data",
             "reason": f"I chose {closest} because it is closest to {target}."
@@ -248,10 +446,15 @@ class DataDomain(Domain):
 
     def _resolve_rhs(self, token, context):
         data_store = context.get("data_store", {})
-        token = token.strip().split()[0]
+        token = _first_word(token)
         if token in data_store:
             return data_store[token][0]
         try:
             return float(token)
         except ValueError:
             return None
+
+
+def _first_word(text):
+    words = text.split()
+    return words[0] if words else ""
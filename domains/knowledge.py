@@ -1,9 +1,17 @@
+from core.utterance import Utterance
 from domains.base import Domain, DomainResponse
 from external.eki import ExternalKnowledgeInterface, ExternalKnowledgeRequest
+from memory.index import edit_distance, TrigramIndex
 
 
 class KnowledgeDomain(Domain):
     name = "KNOWLEDGE"
+    deterministic = True
+    reads_memory = True
+    prefixes = (
+        "what is", "explain", "define",
+        "tell me about", "what do you know about", "forget"
+    )
 
     def __init__(self):
         self.core_knowledge = {
@@ -13,21 +21,16 @@ class KnowledgeDomain(Domain):
             "force": "Force is an interaction that changes the motion of an object.",
             "energy": "Energy is the capacity to do work."
         }
+        self.core_index = TrigramIndex(self.core_knowledge)
         self.eki = ExternalKnowledgeInterface()
 
-    def can_handle(self, context):
-        text = context.get("raw_input", "").lower()
-        return (
-            text.startswith((
-                "what is", "explain", "define",
-                "tell me about", "what do you know about", "forget"
-            ))
-            or context.get("pending_external")
-        )
+    def claims(self, context):
+        return bool(context.get("pending_external"))
 
     def handle(self, context):
         memory = context["memory"]
-        raw = context.get("raw_input", "").strip().lower()
+        utterance = Utterance.of(context)
+        raw = utterance.text
 
         # ---------- Follow-up answer ----------
         if context.get("pending_external"):
@@ -35,9 +38,15 @@ class KnowledgeDomain(Domain):
             concept = context.pop("pending_external")
 
             if answer in {"yes", "y", "sure", "ok"}:
-                result = self.eki.fetch(
-                    ExternalKnowledgeRequest(concept=concept)
-                )
+                with context["metrics"].phase("external_fetch"):
+                    result = self.eki.fetch(
+                        ExternalKnowledgeRequest(concept=concept)
+                    )
+
+                context["last_decision"] = {
+                    "type": "knowledge",
+                    "reason": self._explain_external(concept, result)
+                }
 
                 if not result.summaries:
                     return DomainResponse(True, "External information unavailable.")
@@ -54,10 +63,19 @@ class KnowledgeDomain(Domain):
         # ---------- Forget ----------
         if raw.startswith("forget"):
             concept = raw.replace("forget", "", 1).strip()
+            if memory.get(concept) is not None:
+                context["history"].record(
+                    context, f"Forgot '{concept}'", [("user_knowledge", concept)]
+                )
             if memory.forget(concept):
                 return DomainResponse(True, f"I’ve forgotten {concept}.")
             return DomainResponse(True, f"I don’t have anything stored for {concept}.")
 
+        # ---------- A question about stored data ("the median of marks") ----------
+        source = utterance.after("of")
+        if source and source.split()[0] in utterance.refs:
+            return DomainResponse(False)
+
         # ---------- Extract ----------
         concept = self._extract(raw)
         if not concept:
@@ -72,14 +90,81 @@ class KnowledgeDomain(Domain):
         if concept in self.core_knowledge:
             return DomainResponse(True, self.core_knowledge[concept])
 
-        # ---------- Unknown ----------
+        # ---------- Near match: a typo or plural is answered ----------
+        match = self._closest(concept, memory)
+        variant = match and self._variant(concept, match[0])
+        if variant:
+            name, definition, score = match
+            answer = f"{name}: {definition}" if memory.get(name) else definition
+            context["last_decision"] = {
+                "type": "knowledge",
+                "reason": (
+                    f"I have nothing stored under '{concept}', but it is {variant} "
+                    f"'{name}', so I answered for '{name}'."
+                )
+            }
+            return DomainResponse(
+                True, f"(Closest match to '{concept}': {name}.)\n{answer}"
+            )
+
+        # ---------- Unknown (a similar concept is only suggested) ----------
         context["pending_external"] = concept
+        suggestion = f"Did you mean '{match[0]}'? " if match else ""
+        if match:
+            context["last_decision"] = {
+                "type": "knowledge",
+                "reason": (
+                    f"'{match[0]}' shares {match[2]:.0%} of its letter triples with "
+                    f"'{concept}', but it is not a typo or plural of it, so it may be "
+                    "a different concept; I only suggested it."
+                )
+            }
         return DomainResponse(
             True,
-            f"I don’t have internal knowledge about '{concept}'. "
+            f"I don’t have internal knowledge about '{concept}'. {suggestion}"
             f"Do you want me to look it up using external sources?"
         )
 
+    def _explain_external(self, concept, result):
+        """
+        What the lookup did: where the answer came from, and the providers'
+        notes (cache hits, timeouts, failures).
+        """
+        lines = [f"You asked me to look up '{concept}' in external sources."]
+        if result.sources:
+            lines.append(
+                f"The answer comes from {', '.join(sorted(result.sources))}, "
+                f"with confidence {result.confidence}."
+            )
+        if result.notes:
+            lines += result.notes.split(" | ")
+        return "\n".join(lines)
+
+    def _closest(self, concept, memory):
+        """
+        The best-spelled known concept, from stored or core knowledge, as
+        (name, definition, score); None if nothing is close enough.
+        """
+        candidates = memory.similar(concept, limit=1) + self.core_index.search(concept, limit=1)
+        if not candidates:
+            return None
+        name, score = min(candidates, key=lambda item: (-item[1], item[0]))
+        definition = memory.get(name) or self.core_knowledge[name]
+        return name, definition, score
+
+    def _variant(self, concept, name):
+        """
+        How `concept` is a spelling of `name` ("the plural of", "a typo
+        for"), or None. Words up to 7 letters allow one slip, longer ones two.
+        """
+        for suffix in ("es", "s"):
+            if concept == name + suffix:
+                return "the plural of"
+        limit = 1 if len(name) < 8 else 2
+        if edit_distance(concept, name, limit) <= limit:
+            return "a typo for"
+        return None
+
     def _extract(self, text):
         for p in (
             "what is", "explain", "define",
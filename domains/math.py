@@ -1,32 +1,43 @@
+from core.utterance import Utterance
 from domains.base import Domain, DomainResponse
-import re
+from utils.expression import compile_expression, ExpressionError
 import math
 
 
 class MathDomain(Domain):
     name = "MATH"
-
-    def can_handle(self, context):
-        text = context["raw_input"].lower()
-        return text.startswith("solve") or "=" in text
+    deterministic = True
+    triggers = ("=",)
+    prefixes = ("solve", "calculate", "evaluate")
 
     def handle(self, context):
-        text = context["raw_input"].lower().strip()
+        text = Utterance.of(context).text
         context.pop("last_decision", None)
 
+        if text.startswith(("calculate", "evaluate")):
+            return self._calculate(text, context)
+
         if not text.startswith("solve"):
             return DomainResponse(False)
 
         equation = text.replace("solve", "", 1).strip()
+        if equation.count("=") != 1:
+            return DomainResponse(True, needs_clarification=True)
+
         lhs, rhs = equation.split("=")
         lhs, rhs = lhs.strip(), rhs.strip()
 
-        var = self._detect_variable(lhs + rhs)
-        if not var:
+        try:
+            expr = compile_expression(f"({lhs}) - ({rhs})")
+        except ExpressionError:
+            return DomainResponse(True, needs_clarification=True)
+
+        if len(expr.variables) != 1:
             return DomainResponse(True, needs_clarification=True)
+        var = expr.variables[0]
 
         try:
-            sols, steps = self._solve(lhs, rhs, var)
+            sols, steps = self._solve(expr, var)
         except Exception:
             return DomainResponse(True, needs_clarification=True)
 
@@ -44,12 +55,36 @@ class MathDomain(Domain):
         sol_text = " and ".join(f"{var} = {s}" for s in sols)
         return DomainResponse(True, f"The solutions are {sol_text}.")
 
-    # ---------------- SOLVER ----------------
-    def _solve(self, lhs, rhs, var):
-        expr = f"({lhs}) - ({rhs})".replace("^", "**")
-        expr = re.sub(rf"(\d)({var})", r"\1*\2", expr)
+    # ---------------- ARITHMETIC ----------------
+    def _calculate(self, text, context):
+        source = text.split(None, 1)[1] if " " in text else ""
 
-        f = lambda x: eval(expr.replace(var, f"({x})"), {"__builtins__": {}})
+        try:
+            expr = compile_expression(source)
+            if expr.variables:
+                return DomainResponse(True, needs_clarification=True)
+            value = expr.evaluate()
+        except (ArithmeticError, TypeError, ValueError):
+            return DomainResponse(True, needs_clarification=True)
+
+        if isinstance(value, complex):
+            return DomainResponse(True, "This expression has no real value.")
+
+        if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+            value = int(value)
+
+        context["last_decision"] = {
+            "type": "math",
+            "reason": (
+                f"I read the expression as {expr.source}.\n"
+                "I evaluated it using the usual order of operations."
+            )
+        }
+        return DomainResponse(True, f"The result is {value}.")
+
+    # ---------------- SOLVER ----------------
+    def _solve(self, expr, var):
+        f = expr.function(var)
         b = f(0)
         a = f(1) - b
 
@@ -62,9 +97,3 @@ class MathDomain(Domain):
             f"I identified a = {a}, b = {b}.",
             f"I solved x = -b / a = {sol}."
         ]
-
-    def _detect_variable(self, text):
-        for ch in text:
-            if ch.isalpha():
-                return ch
-        return None
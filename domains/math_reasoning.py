@@ -1,3 +1,4 @@
+from core.utterance import Utterance
 from domains.base import Domain, DomainResponse
 from domains.math import MathDomain
 import re
@@ -5,20 +6,19 @@ import re
 
 class MathReasoningDomain(Domain):
     name = "MATH_REASONING"
+    deterministic = True
+    triggers = (
+        "a number", "sum of", "increased by",
+        "decreased by", "minus", "equals",
+        "becomes", "travels", "percent of"
+    )
 
     def __init__(self):
         self.math = MathDomain()
 
-    def can_handle(self, context):
-        text = context["raw_input"].lower()
-        return any(t in text for t in [
-            "a number", "sum of", "increased by",
-            "decreased by", "minus", "equals",
-            "becomes", "travels", "percent of"
-        ])
-
     def handle(self, context):
-        text = context["raw_input"].lower().strip()
+        utterance = Utterance.of(context)
+        text = utterance.text
 
         # -------- LINEAR WORD PROBLEMS --------
         equation = self._parse_linear_equation(text)
@@ -66,6 +66,10 @@ class MathReasoningDomain(Domain):
             }
             return DomainResponse(True, f"{p} percent of {v} is {result}.")
 
+        # -------- "sum of marks" is a question about stored data --------
+        if utterance.refs:
+            return DomainResponse(False)
+
         return DomainResponse(True, needs_clarification=True)
 
     # ---------------- HELPERS ----------------
@@ -3,10 +3,7 @@ from domains.base import Domain, DomainResponse
 
 class WhyDomain(Domain):
     name = "WHY"
-
-    def can_handle(self, context):
-        raw = context["raw_input"].lower().strip()
-        return raw == "why" or raw.startswith("why ")
+    prefixes = ("why",)
 
     def handle(self, context):
         last = context.get("last_decision")
@@ -0,0 +1,136 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+
+Cached = namedtuple("Cached", ["result", "fresh"])
+
+
+def normalize(concept):
+    return " ".join(concept.lower().split())
+
+
+class KnowledgeCache:
+    """
+    Disk-backed cache of provider results, keyed by provider and concept.
+
+    - Entries expire after `ttl` seconds; misses (None results) are cached
+      too, for the shorter `negative_ttl`.
+    - Expired entries are still returned (fresh=False) so a caller can
+      fall back on them when the provider is unreachable.
+    - The cache holds at most `max_entries` rows; the least recently used
+      are dropped first. Reads note their access time in memory, written
+      together once `ACCESS_BATCH` entries were read and before entries
+      are dropped, so a cache hit costs no disk write. Times not yet
+      written when the process exits only make eviction less exact.
+
+    A cache that cannot be opened or written behaves as always empty.
+    """
+
+    FILE = "mlang_eki_cache.sqlite3"
+    TTL = 7 * 24 * 3600
+    NEGATIVE_TTL = 3600
+    MAX_ENTRIES = 10000
+    ACCESS_BATCH = 64
+
+    def __init__(self, path=None, ttl=None, negative_ttl=None, max_entries=None):
+        self.path = path or KnowledgeCache.FILE
+        self.ttl = KnowledgeCache.TTL if ttl is None else ttl
+        self.negative_ttl = (
+            KnowledgeCache.NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        )
+        self.max_entries = (
+            KnowledgeCache.MAX_ENTRIES if max_entries is None else max_entries
+        )
+
+        self._db = None
+        self._lock = threading.Lock()
+        self._accessed = {}         # (provider, concept) -> last read, not yet written
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " provider TEXT NOT NULL,"
+                " concept TEXT NOT NULL,"
+                " result TEXT,"
+                " stored_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (provider, concept))"
+            )
+            self._db.commit()
+        return self._db
+
+    # --------------------------------------------------
+    # LOOKUP
+    # --------------------------------------------------
+    def get(self, provider, concept):
+        """
+        Return Cached(result, fresh) or None when nothing is stored.
+        """
+        key = (provider, normalize(concept))
+        now = time.time()
+
+        try:
+            with self._lock:
+                db = self._connect()
+                row = db.execute(
+                    "SELECT result, stored_at FROM entries"
+                    " WHERE provider = ? AND concept = ?", key
+                ).fetchone()
+                if row is None:
+                    return None
+
+                self._accessed[key] = now
+                if len(self._accessed) >= KnowledgeCache.ACCESS_BATCH:
+                    self._write_accesses(db)
+                    db.commit()
+        except sqlite3.Error:
+            return None
+
+        result = json.loads(row[0]) if row[0] is not None else None
+        ttl = self.ttl if result is not None else self.negative_ttl
+        return Cached(result, now - row[1] < ttl)
+
+    # --------------------------------------------------
+    # STORE
+    # --------------------------------------------------
+    def put(self, provider, concept, result):
+        key = (provider, normalize(concept))
+        now = time.time()
+        payload = json.dumps(result) if result is not None else None
+
+        try:
+            with self._lock:
+                db = self._connect()
+                # Eviction below goes by access time
+                self._write_accesses(db)
+                db.execute(
+                    "INSERT OR REPLACE INTO entries"
+                    " (provider, concept, result, stored_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?)", (*key, payload, now, now)
+                )
+
+                excess = db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                excess -= self.max_entries
+                if excess > 0:
+                    db.execute(
+                        "DELETE FROM entries WHERE rowid IN ("
+                        " SELECT rowid FROM entries"
+                        " ORDER BY accessed_at LIMIT ?)", (excess,)
+                    )
+                db.commit()
+        except sqlite3.Error:
+            return
+
+    def _write_accesses(self, db):
+        # Called with the lock held; the caller commits
+        db.executemany(
+            "UPDATE entries SET accessed_at = ?"
+            " WHERE provider = ? AND concept = ?",
+            [(when, *key) for key, when in self._accessed.items()]
+        )
+        self._accessed.clear()
@@ -1,5 +1,11 @@
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+import queue
+import threading
+import time
+
 from external.providers.wikipedia import WikipediaProvider
 from external.confidence import aggregate
+from external.cache import KnowledgeCache
 from dataclasses import dataclass
 
 
@@ -18,24 +24,92 @@ class ExternalKnowledgeResult:
     notes: str = ""
 
 
+class _Workers:
+    """
+    `count` daemon threads, started on first use and shared by every
+    interface for the life of the process; unlike ThreadPoolExecutor's
+    workers they never delay interpreter exit.
+
+    A job the caller gave up on while it ran (a provider ignoring its
+    timeout) gets its worker replaced at once; the stuck thread exits when
+    the call returns, if ever. Hung lookups therefore never leave later
+    fetches waiting in the queue.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self._jobs = queue.SimpleQueue()
+        self._started = 0
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        with self._lock:
+            while self._started < self.count:
+                self._start()
+
+        future = Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    def give_up(self, future):
+        """
+        Drop a job: cancelled if it has not started, else its worker is
+        replaced.
+        """
+        if future.cancel() or future.done():
+            return
+        with self._lock:
+            self._abandoned.add(future)
+            self._start()
+
+    def _start(self):
+        # Called with the lock held
+        threading.Thread(
+            target=self._work, name=f"mlang-eki-{self._started}", daemon=True
+        ).start()
+        self._started += 1
+
+    def _work(self):
+        while True:
+            future, fn, args = self._jobs.get()
+            # Skipped if the fetch gave up on it before it started
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as exc:
+                future.set_exception(exc)
+
+            with self._lock:
+                if future in self._abandoned:
+                    # A replacement took over this worker's place
+                    self._abandoned.discard(future)
+                    return
+
+
 class ExternalKnowledgeInterface:
-    def __init__(self):
+    # Overall budget for one fetch; each provider also has its own timeout
+    DEADLINE = 10.0
+
+    _workers = _Workers(8)
+
+    def __init__(self, cache=None, deadline=None):
         self.providers = [
             WikipediaProvider(),
         ]
+        self.cache = cache if cache is not None else KnowledgeCache()
+        self.deadline = (
+            ExternalKnowledgeInterface.DEADLINE if deadline is None else deadline
+        )
 
     def fetch(self, request: ExternalKnowledgeRequest):
-        collected = []
-
-        for provider in self.providers:
-            result = provider.fetch(request.concept)
-            if result:
-                collected.append(result)
+        collected, fetch_notes = self._gather(request.concept)
 
         if not collected:
             return ExternalKnowledgeResult(
                 request.concept, [], 0.0, [],
-                "No reliable external sources found."
+                " | ".join(["No reliable external sources found."] + fetch_notes)
             )
 
         confidence = aggregate(collected)
@@ -61,5 +135,108 @@ class ExternalKnowledgeInterface:
             summaries=summaries,
             confidence=confidence,
             sources=list(set(sources)),
-            notes=" | ".join(set(notes))
+            notes=" | ".join(list(set(notes)) + fetch_notes)
         )
+
+    def _gather(self, concept):
+        """
+        Query all providers concurrently. Each gets until its own timeout
+        or the overall deadline, whichever comes first; whatever has
+        arrived by then is returned. Returns (results in provider order,
+        notes).
+        """
+        start = time.monotonic()
+        finish = start + self.deadline
+
+        futures = {
+            self._workers.submit(self._fetch_cached, provider, concept): (i, provider)
+            for i, provider in enumerate(self.providers)
+        }
+
+        def cutoff(future):
+            return min(start + futures[future][1].timeout, finish)
+
+        arrived = []
+        notes = []
+        timed_out = []
+        failed = []
+        pending = set(futures)
+
+        try:
+            while pending:
+                now = time.monotonic()
+                for future in [f for f in pending if cutoff(f) <= now]:
+                    pending.discard(future)
+                    self._workers.give_up(future)
+                    i, provider = futures[future]
+                    timed_out.append(provider.name)
+
+                    # A hung provider can still be answered from a stale entry
+                    cached = self.cache.get(provider.name, concept)
+                    if cached and cached.result:
+                        arrived.append((i, cached.result))
+                        notes.append(f"{provider.name}: used cached result.")
+
+                if not pending:
+                    break
+
+                done, _ = wait(
+                    pending,
+                    timeout=min(cutoff(f) for f in pending) - now,
+                    return_when=FIRST_COMPLETED
+                )
+                for future in done:
+                    pending.discard(future)
+                    i, provider = futures[future]
+                    try:
+                        result, note = future.result()
+                    except Exception:
+                        failed.append(provider.name)
+                        continue
+
+                    if note:
+                        notes.append(note)
+                    if result:
+                        arrived.append((i, result))
+        finally:
+            for future in pending:
+                self._workers.give_up(future)
+
+        if timed_out:
+            notes.append(f"Timed out: {', '.join(timed_out)}.")
+        if failed:
+            notes.append(f"Failed: {', '.join(failed)}.")
+
+        arrived.sort(key=lambda item: item[0])
+        return [r for _, r in arrived], notes
+
+    def _fetch_cached(self, provider, concept):
+        """
+        Returns (result, cache note). Fresh cache entries, including cached
+        misses, skip the provider; a stale entry is used only when the
+        provider cannot answer. Only a provider's answer that it has
+        nothing is cached as a miss; when it cannot be reached, the error
+        propagates (reported as failed) and nothing is cached.
+        """
+        cached = self.cache.get(provider.name, concept)
+        if cached and cached.fresh:
+            if cached.result:
+                return cached.result, f"{provider.name}: cache hit."
+            return None, f"{provider.name}: cached miss."
+
+        try:
+            result = provider.fetch(concept)
+        except Exception:
+            if cached and cached.result:
+                return cached.result, f"{provider.name}: unavailable, used cached result."
+            raise
+
+        if result:
+            self.cache.put(provider.name, concept, result)
+            return result, None
+
+        if cached and cached.result:
+            return cached.result, f"{provider.name}: no result now, used cached result."
+
+        self.cache.put(provider.name, concept, None)
+        return None, None
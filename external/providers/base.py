@@ -9,6 +9,9 @@ class ExternalProvider(ABC):
 
     name = "BASE"
 
+    # Seconds the interface waits for this provider before moving on
+    timeout = 5.0
+
     @abstractmethod
     def fetch(self, concept: str):
         """
@@ -19,6 +22,8 @@ class ExternalProvider(ABC):
             "sources": list[str],
             "notes": str
         }
-        or None if unavailable
+        or None if the source has nothing on the concept. A source that
+        cannot be reached (network down, library missing) raises instead,
+        so that the miss is not cached.
         """
         pass
@@ -1,4 +1,3 @@
-import wikipedia
 from external.providers.base import ExternalProvider
 
 
@@ -6,13 +5,16 @@ class WikipediaProvider(ExternalProvider):
     name = "Wikipedia"
 
     def fetch(self, concept: str):
+        import wikipedia  # deferred: pulls in requests and bs4
+
         try:
             summary = wikipedia.summary(concept, sentences=2, auto_suggest=False)
-            return {
-                "summaries": [summary],
-                "confidence": 0.6,
-                "sources": ["Wikipedia"],
-                "notes": "Community-edited source."
-            }
-        except Exception:
+        except (wikipedia.exceptions.PageError, wikipedia.exceptions.DisambiguationError):
+            # No article, or only a list of other ones: a real answer
             return None
+        return {
+            "summaries": [summary],
+            "confidence": 0.6,
+            "sources": ["Wikipedia"],
+            "notes": "Community-edited source."
+        }
@@ -0,0 +1,57 @@
+import json
+import sys
+
+
+class BatchRunner:
+    """
+    Runs a script of MLang commands without prompts.
+
+    Every non-empty line goes through Engine.handle; lines starting with
+    '#' are comments. Results are written as plain text or as JSON lines.
+    Saving is deferred: the store is written every `checkpoint` commands
+    (0 means only once, at the end of the batch).
+    """
+
+    FORMATS = ("text", "jsonl")
+
+    def __init__(self, app, output=None, fmt="text", checkpoint=0):
+        if fmt not in BatchRunner.FORMATS:
+            raise ValueError(f"Unknown output format: {fmt}")
+
+        self.app = app
+        self.engine = app.engine
+        self.output = output or sys.stdout
+        self.fmt = fmt
+        self.checkpoint = checkpoint
+
+    def run(self, lines):
+        autosave = self.app.autosave
+        self.app.autosave = False
+        handled = 0
+
+        try:
+            for number, line in enumerate(lines, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.lower() == "exit":
+                    break
+
+                result = self.engine.handle(line)
+                self._write(number, line, result)
+
+                handled += 1
+                if self.checkpoint and handled % self.checkpoint == 0:
+                    self.app.flush()
+        finally:
+            self.app.autosave = autosave
+            self.app.flush()
+
+        return handled
+
+    def _write(self, number, line, result):
+        if self.fmt == "jsonl":
+            record = {"line": number, "input": line, "output": result}
+            self.output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            self.output.write(f"{result}\n")
@@ -1,11 +1,15 @@
 class CLI:
-    def __init__(self, engine):
+    def __init__(self, engine, on_ready=None):
         self.engine = engine
+        self.on_ready = on_ready
 
     def run(self):
         print("\nMLang — Universal Human Language Interface")
         print("Type 'exit' to quit\n")
 
+        if self.on_ready:
+            self.on_ready()
+
         while True:
             user = input("You: ").strip()
 
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from domains.advanced_math import LimitCache
+from persistence.store import PersistenceStore
+
+
+log = logging.getLogger(__name__)
+
+
+class Session:
+    """
+    One user's MLang state: its own application, engine context, history
+    and store file. Commands of a session run one at a time.
+    """
+
+    def __init__(self, session_id, app):
+        self.id = session_id
+        self.app = app
+        self.lock = asyncio.Lock()
+        self.connections = 0
+        self.last_used = time.monotonic()
+
+
+class Server:
+    """
+    Line-protocol server hosting many isolated MLang sessions.
+
+    Each request is one line of text; each reply is one JSON line
+    {"session": id, "output": text}. The first line of a connection may
+    be "session <id>" to open or resume a named session (letters, digits,
+    '_' and '-'); otherwise a fresh session is created. "exit" closes the
+    connection. Lines longer than `LINE_LIMIT` bytes are skipped with an
+    error reply, and a command that fails is logged and answered with an
+    error; neither ends the connection.
+
+    Sessions are stored as <store_dir>/<id>.json, so a session survives a
+    restart and can be resumed from another connection. Sessions nobody is
+    connected to are unloaded after `idle_timeout` seconds.
+
+    Everything that can block (store I/O, sympy, external fetches) runs on
+    a thread pool; the event loop only moves lines around.
+    """
+
+    STORE_DIR = "mlang_sessions"
+    MAX_SESSIONS = 10000
+    IDLE_TIMEOUT = 900
+    WORKERS = 8
+    LINE_LIMIT = 1 << 16
+
+    FAILED = "Something went wrong with that command."
+
+    SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+    def __init__(self, factory, host="127.0.0.1", port=7878, store_dir=None,
+                 max_sessions=None, idle_timeout=None, workers=None):
+        self.factory = factory
+        self.host = host
+        self.port = port
+        self.store_dir = store_dir or Server.STORE_DIR
+        self.max_sessions = Server.MAX_SESSIONS if max_sessions is None else max_sessions
+        self.idle_timeout = Server.IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+
+        self.sessions = {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=Server.WORKERS if workers is None else workers,
+            thread_name_prefix="mlang-session"
+        )
+        # Shared by every session: results depend only on the expression
+        self.limit_cache = LimitCache(os.path.join(self.store_dir, LimitCache.FILE))
+        self._opening = {}
+
+    # --------------------------------------------------
+    # LIFECYCLE
+    # --------------------------------------------------
+    async def serve_forever(self, on_ready=None):
+        os.makedirs(self.store_dir, exist_ok=True)
+        server = await asyncio.start_server(
+            self._connection, self.host, self.port, limit=Server.LINE_LIMIT
+        )
+        reaper = asyncio.create_task(self._reap())
+
+        if on_ready:
+            on_ready(server)
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            reaper.cancel()
+            await self._close_all()
+            self.executor.shutdown(wait=True)
+            self.limit_cache.close()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    # --------------------------------------------------
+    # SESSIONS
+    # --------------------------------------------------
+    async def _open(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is not None:
+            return session
+
+        # Two connections opening the same session share one load
+        pending = self._opening.get(session_id)
+        if pending is None:
+            if len(self.sessions) >= self.max_sessions:
+                return None
+            pending = asyncio.ensure_future(self._run(self._create, session_id))
+            self._opening[session_id] = pending
+            try:
+                self.sessions[session_id] = Session(session_id, await pending)
+            finally:
+                del self._opening[session_id]
+            return self.sessions[session_id]
+
+        await pending
+        return self.sessions.get(session_id)
+
+    def _create(self, session_id):
+        store = PersistenceStore(os.path.join(self.store_dir, f"{session_id}.json"))
+        app = self.factory(store=store, limit_cache=self.limit_cache)
+        app.engine.execute = app.execute
+        return app
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(max(1.0, self.idle_timeout / 4))
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                if (
+                    session.connections == 0
+                    and not session.lock.locked()
+                    and now - session.last_used > self.idle_timeout
+                ):
+                    del self.sessions[session.id]
+                    await self._run(session.app.store.close)
+
+    async def _close_all(self):
+        sessions, self.sessions = list(self.sessions.values()), {}
+        for session in sessions:
+            async with session.lock:
+                await self._run(session.app.store.close)
+
+    # --------------------------------------------------
+    # CONNECTIONS
+    # --------------------------------------------------
+    async def _connection(self, reader, writer):
+        session = None
+        try:
+            while True:
+                line = await self._readline(reader)
+                if line is None:
+                    await self._reply(
+                        writer, session and session.id,
+                        f"Lines are limited to {Server.LINE_LIMIT} bytes; that one was ignored."
+                    )
+                    continue
+                if not line:
+                    break
+                text = line.decode("utf-8", "replace").strip()
+                if not text:
+                    continue
+
+                if session is None:
+                    m = re.fullmatch(r"session\s+(\S+)", text, re.IGNORECASE)
+                    if m and not Server.SESSION_ID.fullmatch(m.group(1)):
+                        await self._reply(writer, None, "Session names use letters, digits, '_' and '-'.")
+                        continue
+
+                    session = await self._open(m.group(1) if m else uuid.uuid4().hex)
+                    if session is None:
+                        await self._reply(writer, None, "The server is full. Try again later.")
+                        break
+                    session.connections += 1
+                    if m:
+                        await self._reply(writer, session.id, f"Session '{session.id}' ready.")
+                        continue
+
+                if text.lower() == "exit":
+                    await self._reply(writer, session.id, "Goodbye.")
+                    break
+
+                async with session.lock:
+                    try:
+                        output = await self._run(session.app.engine.handle, text)
+                    except Exception:
+                        log.exception("session %s failed on %r", session.id, text)
+                        output = Server.FAILED
+                    session.last_used = time.monotonic()
+                await self._reply(writer, session.id, output)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            if session is not None:
+                session.connections -= 1
+                session.last_used = time.monotonic()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _readline(self, reader):
+        """
+        The next line; b"" at the end of the input, None for a line over
+        the limit, whose bytes are discarded.
+        """
+        overlong = False
+        while True:
+            try:
+                line = await reader.readuntil(b"\n")
+            except asyncio.IncompleteReadError as exc:
+                line = exc.partial
+            except asyncio.LimitOverrunError as exc:
+                # Drop what is buffered and keep reading to the newline
+                await reader.readexactly(exc.consumed)
+                overlong = True
+                continue
+            return None if overlong else line
+
+    async def _reply(self, writer, session_id, output):
+        record = {"session": session_id, "output": output}
+        writer.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8"))
+        await writer.drain()
@@ -2,125 +2,441 @@
 # MLang - Entry Point (FINAL FIX)
 # ==========================================
 
-import copy
+import argparse
+import importlib
+import os
+import re
+import sys
+import threading
+import time
 
+from core.cache import UNCHANGED, ReadLog, ResponseCache
 from core.engine import Engine
+from core.dataset import Dataset
+from core.derived import DerivedError, DerivedValues, parse_formula
+from core.history import History
+from core.metrics import Metrics
+from core.router import Router
 from core.confidence import ConfidenceEvaluator, ConfidenceLevel
 from core.safety import SafetyEvaluator
+from core.sketch import Z_99, Sketches
+from core.utterance import Utterance
 from interface.cli import CLI
+from interface.batch import BatchRunner
 
 from memory.memory import Memory
-from persistence.store import PersistenceStore
+from persistence.store import DELETED, PersistenceStore
+from utils import datafile
 
 from domains.knowledge import KnowledgeDomain
 from domains.math import MathDomain
 from domains.math_reasoning import MathReasoningDomain
 from domains.calculus import CalculusDomain
-from domains.advanced_math import AdvancedMathDomain
+from domains.advanced_math import AdvancedMathDomain, LimitCache
 from domains.data import DataDomain
 from domains.why import WhyDomain
 
 
+# Imported lazily by the domains that need them; see warm_imports()
+HEAVY_MODULES = ("sympy", "wikipedia")
+
+# load <name> from <file> [column <n or header>]
+LOAD = re.compile(
+    r"\s*load\s+([a-z_]\w*)\s+from\s+(.+?)(?:\s+column\s+(\S+))?\s*",
+    re.IGNORECASE
+)
+
+# append <numbers> to <name>
+APPEND = re.compile(r"append\s+(.+?)\s+to\s+([a-z_]\w*)")
+
+# sketch <name> / stop sketching <name>
+SKETCH = re.compile(r"(sketch|stop sketching)\s+([a-z_]\w*)")
+
+
 class MLangApplication:
-    def __init__(self):
+    def __init__(self, store=None, limit_cache=None, cache_responses=True):
         self.engine = Engine()
 
         # ---------- Load persistent storage ----------
-        saved = PersistenceStore.load()
+        self.store = store if store is not None else PersistenceStore()
+        saved = self.store.load()
+
+        # Batch runs turn this off and flush at checkpoints instead
+        self.autosave = True
 
         memory = Memory()
         memory.load(saved.get("user_knowledge"))
         self.engine.context["memory"] = memory
 
         self.engine.context["data_store"] = saved.get("data_store", {})
-        self.engine.context["history"] = []
-        self.engine.context["future"] = []
+        self.engine.context["history"] = History()
+
+        self.metrics = Metrics()
+        self.engine.context["metrics"] = self.metrics
+        # (domain, outcome) of the request being executed, for the metrics
+        self._served = None
+        # Keys whose change another process overwrote first
+        self._conflicts = []
+
+        self.cache = ResponseCache()
+        # Off to measure the domains themselves (benchmarks/suite.py)
+        self.cache_responses = cache_responses
+
+        derived = DerivedValues()
+        derived.load(saved.get("derived"))
+        self.engine.context["derived"] = derived
+
+        # data_store entries in sketch mode; the sketches are built on demand
+        sketches = Sketches()
+        sketches.load(saved.get("sketches"))
+        self.engine.context["sketches"] = sketches
 
         # ---------- Register domains (ORDER MATTERS) ----------
         self.domains = [
             WhyDomain(),
-            AdvancedMathDomain(),
+            AdvancedMathDomain(limit_cache),
             MathReasoningDomain(),
             CalculusDomain(),
             MathDomain(),
             KnowledgeDomain(),
             DataDomain(),
         ]
+        self.router = Router(self.domains)
 
     # --------------------------------------------------
     # SNAPSHOT FOR UNDO / REDO
     # --------------------------------------------------
-    def _snapshot(self, description):
-        self.engine.context["history"].append({
-            "data_store": copy.deepcopy(self.engine.context["data_store"]),
-            "user_knowledge": copy.deepcopy(
-                self.engine.context["memory"].export()
-            ),
-            "description": description
-        })
-        self.engine.context["future"].clear()
+    def _snapshot(self, description, keys):
+        with self.metrics.phase("snapshot"):
+            self.engine.context["history"].record(
+                self.engine.context, description, keys
+            )
+
+    # --------------------------------------------------
+    # DATA ASSIGNMENT
+    # --------------------------------------------------
+    def _assign(self, name, values, description, definition=None):
+        """
+        Store `values` under `name` and recompute every derived value that
+        depends on it. `definition` is the formula text when `name` is itself
+        derived; a plain assignment drops any earlier definition.
+        Returns the names that were recomputed and {name: reason} for
+        those that could not be.
+        """
+        context = self.engine.context
+        data_store = context["data_store"]
+        derived = context["derived"]
+
+        affected = derived.affected(name)
+        keys = [("data_store", name)] + [("data_store", n) for n in affected]
+        if definition is not None or derived.get(name) is not None:
+            keys.append(("derived", name))
+        self._snapshot(description, keys)
+
+        if definition is None:
+            derived.remove(name)
+        else:
+            derived.set(name, definition)
+
+        data_store[name] = values
+        return derived.recompute(data_store, affected)
+
+    def _define(self, name, formula):
+        context = self.engine.context
+        data_store = context["data_store"]
+        derived = context["derived"]
+
+        missing = [s for s in formula.sources if s not in data_store]
+        if missing:
+            return f"I don't have any data called '{missing[0]}' yet."
+
+        if name in derived.upstream(formula.sources):
+            return f"'{name}' can't be defined in terms of itself."
+
+        try:
+            value = formula.evaluate(data_store)
+        except DerivedError as exc:
+            return f"I can't compute '{name}': {exc}."
+
+        updated = self._assign(name, value, f"Defined '{name}'", formula.text)
+
+        context["last_decision"] = {
+            "type": "derived",
+            "reason": (
+                f"I computed '{name}' as {formula.description}.\n"
+                f"It is recomputed whenever {', '.join(formula.sources)} changes."
+            )
+        }
+        self._persist()
+        return f"Stored {value} as '{name}'." + _recomputed(updated)
+
+    def _load(self, name, path, column):
+        try:
+            dataset = datafile.load(path.strip("'\""), column)
+        except datafile.DataFileError as exc:
+            return f"I couldn't load '{name}': {exc}."
+
+        updated = self._assign(name, dataset, f"Loaded '{name}'")
+
+        source = dataset.source
+        reason = f"I read {source['path']} as {datafile.describe(source)}"
+        if column is not None:
+            reason += f", column {column}"
+        if isinstance(dataset.values, memoryview):
+            reason += ".\nThe file is memory-mapped: values are read in place, not copied."
+        else:
+            reason += "."
+        reason += "\nOnly the file reference is saved; it is read again next time."
+
+        self.engine.context["last_decision"] = {"type": "data", "reason": reason}
+        self._persist()
+        return (
+            f"Loaded {len(dataset)} values into '{name}' from "
+            f"{os.path.basename(source['path'])}." + _recomputed(updated)
+        )
+
+    def _append(self, name, text):
+        context = self.engine.context
+        before = context["data_store"].get(name)
+        if before is None:
+            return f"I don't have any data called '{name}' yet."
+
+        values = Utterance(text).numbers
+        if not values:
+            return f"Which values should I append to '{name}'?"
+
+        added = Dataset(values)
+        after = before.appended(added)
+        updated = self._assign(name, after, f"Appended to '{name}'")
+
+        if context["sketches"].appended(name, before, after, added):
+            context["last_decision"] = {
+                "type": "data",
+                "reason": (
+                    f"I added the {len(added)} new values to the sketch of '{name}' "
+                    f"instead of rebuilding it from all {len(after)}."
+                )
+            }
+
+        self._persist()
+        return (
+            f"Appended {list(values)} to '{name}' ({len(after)} values)."
+            + _recomputed(updated)
+        )
+
+    def _sketch(self, name, enable):
+        context = self.engine.context
+        sketches = context["sketches"]
+
+        if not enable:
+            if sketches.disable(name):
+                # Its answers switch from approximate to exact
+                self.cache.clear()
+                self._persist()
+                return f"Stopped sketching '{name}'; its answers are exact again."
+            return f"'{name}' isn't being sketched."
+
+        dataset = context["data_store"].get(name)
+        if dataset is None:
+            return f"I don't have any data called '{name}' yet."
+
+        sketch = sketches.enable(name, dataset)
+        self.cache.clear()
+        self._persist()
+        quantiles, distinct = sketch.quantiles, sketch.distinct
+        context["last_decision"] = {
+            "type": "data",
+            "reason": (
+                f"A KLL sketch keeps {quantiles.retained} of the {len(dataset)} values "
+                f"(ranks within ±{quantiles.rank_error:.1%}) and a HyperLogLog counter "
+                f"with {len(distinct.registers)} registers counts distinct values "
+                f"(within ±{Z_99 * distinct.standard_error:.1%}), both at 99% confidence. "
+                f"Appended values update them; any other change rebuilds them."
+            )
+        }
+        return (
+            f"Sketching '{name}' ({len(dataset)} values): its percentiles and "
+            f"distinct count are now approximate."
+        )
+
+    @staticmethod
+    def _parse_assignment(utterance):
+        if _compares(utterance):
+            return None
+        m = re.fullmatch(r"([a-z_]\w*)\s*=\s*(.+)", utterance.text)
+        return m.groups() if m else None
 
     # --------------------------------------------------
     # MAIN EXECUTION
     # --------------------------------------------------
     def execute(self):
+        start = time.perf_counter()
+        self._served = ("NONE", "unhandled")
+        try:
+            # Pick up what other MLang processes saved meanwhile
+            self._merge(self.store.refresh())
+            result = self._execute()
+
+            if self._conflicts:
+                # A derived value conflicts as a definition and as data
+                names = ", ".join(f"'{key}'" for key in dict.fromkeys(k for _, k in self._conflicts))
+                self._conflicts = []
+                result += (
+                    f"\nAnother MLang process changed {names} first; "
+                    "I kept its version."
+                )
+            return result
+        finally:
+            domain, outcome = self._served
+            self.metrics.inc("mlang_requests_total", domain=domain, outcome=outcome)
+            self.metrics.observe(
+                "mlang_request_seconds", time.perf_counter() - start, domain=domain
+            )
+
+    def _execute(self):
         context = self.engine.context
         raw_input = context.get("raw_input", "")
-        raw = raw_input.strip().lower()
+        utterance = Utterance.of(context)
+        raw = utterance.text
+
+        # ---------------- STATS ----------------
+        if raw == "stats" or raw.startswith("stats "):
+            self._served = ("STATS", "handled")
+            return self.stats(raw.split(None, 1)[1] if " " in raw else "text")
 
         # ---------------- UNDO ----------------
         if raw.startswith("undo"):
+            self._served = ("HISTORY", "handled")
             parts = raw.split()
-            return self.engine.undo(int(parts[1])) if len(parts) == 2 and parts[1].isdigit() else self.engine.undo()
+            result = self.engine.undo(int(parts[1])) if len(parts) == 2 and parts[1].isdigit() else self.engine.undo()
+            self._persist()
+            return result
 
         # ---------------- REDO ----------------
         if raw.startswith("redo"):
+            self._served = ("HISTORY", "handled")
             parts = raw.split()
-            return self.engine.redo(int(parts[1])) if len(parts) == 2 and parts[1].isdigit() else self.engine.redo()
+            result = self.engine.redo(int(parts[1])) if len(parts) == 2 and parts[1].isdigit() else self.engine.redo()
+            self._persist()
+            return result
+
+        # --------------------------------------------------
+        # DATA IMPORT ("load readings from data.npy")
+        # Before routing: file names may contain any domain's trigger
+        # --------------------------------------------------
+        m = LOAD.fullmatch(raw_input)
+        if m:
+            self._served = ("LOAD", "handled")
+            name, path, column = m.groups()
+            return self._load(name.lower(), path, column)
+
+        # --------------------------------------------------
+        # APPEND ("append 4, 5 to latency") AND SKETCH MODE ("sketch latency")
+        # --------------------------------------------------
+        m = APPEND.fullmatch(raw)
+        if m:
+            self._served = ("APPEND", "handled")
+            return self._append(m.group(2), m.group(1))
+
+        m = SKETCH.fullmatch(raw)
+        if m:
+            self._served = ("SKETCH", "handled")
+            return self._sketch(m.group(2), m.group(1) == "sketch")
+
+        # --------------------------------------------------
+        # DERIVED VALUES ("avg_marks = average of marks")
+        # Checked before routing: "sum of" would otherwise reach MathReasoning
+        # --------------------------------------------------
+        assignment = self._parse_assignment(utterance)
+        if assignment:
+            formula = parse_formula(assignment[1])
+            if formula is not None:
+                self._served = ("DERIVED", "handled")
+                return self._define(assignment[0], formula)
+
+        # --------------------------------------------------
+        # RESPONSE CACHE (same input, same data -> same answer)
+        # Not while a domain waits for a follow-up answer
+        # --------------------------------------------------
+        cacheable = self.cache_responses and not any(
+            domain.claims(context) for domain in self.domains
+        )
+        if cacheable:
+            entry = self.cache.get(utterance, context)
+            if entry is not None:
+                self._served = (entry.domain, "handled")
+                context["route"] = {"domain": entry.domain, "trigger": entry.trigger}
+                if entry.decision is not UNCHANGED:
+                    context["last_decision"] = entry.decision
+                return entry.message
 
         # --------------------------------------------------
         # 🔥 DOMAIN ROUTING (FIRST — CRITICAL FIX)
         # --------------------------------------------------
-        for domain in self.domains:
-            if domain.can_handle(context):
-                response = domain.handle(context)
+        with self.metrics.phase("routing"):
+            routes = self.router.route(context)
+
+        memory = context["memory"]
+        for domain, trigger in routes:
+            context["route"] = {"domain": domain.name, "trigger": trigger}
+            decision, version = context.get("last_decision"), memory.version
+            # Record which entries the domain reads, for the cache
+            reads = ReadLog(context["data_store"]) if cacheable else None
+            if reads is not None:
+                context["data_store"] = reads
+            try:
+                with self.metrics.phase("handle", domain=domain.name):
+                    response = domain.handle(context)
+            finally:
+                if reads is not None:
+                    context["data_store"] = reads.data_store
+
+            if response.needs_clarification:
+                self._served = (domain.name, "clarification")
+                return "I need a bit more clarity. Can you explain what you mean?"
 
-                if response.needs_clarification:
-                    return "I need a bit more clarity. Can you explain what you mean?"
+            if response.handled:
+                self._served = (domain.name, "handled")
+                if (
+                    cacheable
+                    and domain.deterministic
+                    and memory.version == version
+                    and not context.get("pending_external")
+                ):
+                    after = context.get("last_decision")
+                    self.cache.put(
+                        utterance, context, domain, trigger, response.message,
+                        UNCHANGED if after is decision else after, reads
+                    )
+                self._persist()
+                return response.message
 
-                if response.handled:
-                    self._persist()
-                    return response.message
+        context.pop("route", None)
 
         # --------------------------------------------------
         # 🔹 DATA ASSIGNMENT (FALLBACK ONLY)
         # --------------------------------------------------
+        equals = raw.find("=")
         if (
-            "=" in raw
+            equals >= 0
             and not raw.startswith(("solve", "evaluate", "calculate"))
-            and not any(op in raw for op in ["==", ">=", "<="])
+            and not _compares(utterance)
         ):
-            name, values = raw.split("=", 1)
-            name = name.strip()
-
-            numbers = []
-            for t in values.replace(",", " ").split():
-                try:
-                    numbers.append(float(t))
-                except ValueError:
-                    continue
+            name = raw[:equals].strip()
+            numbers = list(utterance.numbers_after(equals))
 
             if numbers:
-                self._snapshot(f"Stored '{name}'")
-                context["data_store"][name] = numbers
+                self._served = ("ASSIGN", "handled")
+                updated = self._assign(name, Dataset(numbers), f"Stored '{name}'")
                 self._persist()
-                return f"Stored {numbers} as '{name}'."
+                return f"Stored {numbers} as '{name}'." + _recomputed(updated)
 
         # --------------------------------------------------
         # SAFETY
         # --------------------------------------------------
         safety = SafetyEvaluator.evaluate(raw_input)
         if safety.level.name == "HIGH":
+            self._served = ("NONE", "refused")
             return "I can’t proceed safely."
 
         # --------------------------------------------------
@@ -128,9 +444,11 @@ class MLangApplication:
         # --------------------------------------------------
         confidence = ConfidenceEvaluator.evaluate(context)
         if confidence.level == ConfidenceLevel.LOW:
+            self._served = ("NONE", "clarification")
             return "I need a bit more clarity. Can you explain what you mean?"
 
         if confidence.level == ConfidenceLevel.CRITICAL:
+            self._served = ("NONE", "refused")
             return f"I can’t proceed safely.\nReason: {confidence.reason}"
 
         return "I understood the request, but I don’t know how to handle it yet."
@@ -139,16 +457,200 @@ class MLangApplication:
     # SAVE STATE
     # --------------------------------------------------
     def _persist(self):
-        PersistenceStore.save(
-            self.engine.context["data_store"],
-            self.engine.context["memory"].export()
+        if self.autosave:
+            self.flush()
+
+    def flush(self):
+        with self.metrics.phase("persist"):
+            sync = self.store.save(
+                self.engine.context["data_store"],
+                self.engine.context["memory"].export(),
+                self.engine.context["derived"].export(),
+                self.engine.context["sketches"].export()
+            )
+        self._merge(sync.merged)
+        self._conflicts += sync.conflicts
+
+    def _merge(self, changes):
+        """
+        Apply changes saved by other processes to the live context.
+        """
+        context = self.engine.context
+        for (section, key), value in changes.items():
+            if section == "data_store":
+                if value is DELETED:
+                    context["data_store"].pop(key, None)
+                else:
+                    context["data_store"][key] = value
+            elif section == "user_knowledge":
+                if value is DELETED:
+                    context["memory"].forget(key)
+                else:
+                    context["memory"].learn(key, value)
+            elif section == "derived":
+                if value is DELETED:
+                    context["derived"].remove(key)
+                    continue
+                try:
+                    context["derived"].set(key, value)
+                except DerivedError:
+                    continue
+            elif section == "sketches":
+                if value is DELETED:
+                    context["sketches"].disable(key)
+                else:
+                    context["sketches"].enable(key)
+                # Its answers switch between exact and approximate
+                self.cache.clear()
+
+    # --------------------------------------------------
+    # METRICS
+    # --------------------------------------------------
+    def stats(self, fmt="text"):
+        """
+        Metrics as text, "json" or "prometheus", with the response and limit
+        cache counters.
+        """
+        limits = next(
+            (d.cache.stats() for d in self.domains if isinstance(d, AdvancedMathDomain)),
+            None
+        )
+        responses = self.cache.stats()
+
+        if fmt == "json":
+            return self.metrics.to_json({"response_cache": responses, "limit_cache": limits})
+
+        if fmt == "prometheus":
+            gauges = [(f"mlang_response_cache_{key}", value) for key, value in responses.items()]
+            if limits is not None:
+                gauges += [(f"mlang_limit_cache_{key}", value) for key, value in limits.items()]
+            return self.metrics.to_prometheus(gauges)
+
+        text = self.metrics.summary()
+        text += (
+            f"\nResponse cache: {responses['entries']} entries, "
+            f"{responses['hits']} hits, {responses['misses']} misses."
         )
+        if limits is not None:
+            text += (
+                f"\nLimit cache: {limits['entries']} entries, "
+                f"{limits['hits']} hits, {limits['misses']} misses."
+            )
+        return text
+
+
+def _recomputed(outcome):
+    updated, failed = outcome
+    text = f" Recomputed {', '.join(updated)}." if updated else ""
+    for name, reason in failed.items():
+        text += f" I kept the old '{name}': {reason}."
+    return text
+
+
+def _compares(utterance):
+    # "x == 3", "x >= 3": a comparison, not an assignment
+    return any(op in ("==", ">=", "<=") for op, _ in utterance.comparators)
 
 
-def main():
-    app = MLangApplication()
+def warm_imports():
+    """
+    Import the heavy optional modules on a background thread, so the first
+    limit or external lookup does not pay for them at the prompt.
+    """
+    def load():
+        for module in HEAVY_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                continue
+
+    threading.Thread(target=load, daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="MLang")
+    parser.add_argument(
+        "--batch", metavar="FILE",
+        help="run commands from FILE ('-' for stdin) instead of the prompt"
+    )
+    parser.add_argument(
+        "--format", choices=BatchRunner.FORMATS, default="text",
+        help="batch output format"
+    )
+    parser.add_argument(
+        "--checkpoint", type=int, default=0, metavar="N",
+        help="in batch mode, save every N commands (default: at the end)"
+    )
+    parser.add_argument(
+        "--no-warm", action="store_true",
+        help="do not preload heavy modules after the prompt appears"
+    )
+    parser.add_argument(
+        "--store", metavar="FILE",
+        help="where to keep data and knowledge (default: mlang_store.json;"
+             " a .sqlite3 or .db file uses the SQLite backend)"
+    )
+    parser.add_argument(
+        "--serve", metavar="HOST:PORT",
+        help="serve many sessions over a line protocol instead of the prompt"
+    )
+    parser.add_argument(
+        "--sessions", metavar="DIR",
+        help="with --serve, directory holding one store per session"
+             " (default: mlang_sessions)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        return serve(args.serve, args.sessions, warm=not args.no_warm)
+
+    store = open_store(args.store)
+    # Limit results are kept next to the store
+    limit_cache = LimitCache(os.path.join(os.path.dirname(store.path), LimitCache.FILE))
+    app = MLangApplication(store=store, limit_cache=limit_cache)
     app.engine.execute = app.execute
-    CLI(app.engine).run()
+    try:
+        if args.batch is None:
+            CLI(app.engine, on_ready=None if args.no_warm else warm_imports).run()
+        elif args.batch == "-":
+            BatchRunner(app, fmt=args.format, checkpoint=args.checkpoint).run(sys.stdin)
+        else:
+            with open(args.batch, "r") as script:
+                BatchRunner(app, fmt=args.format, checkpoint=args.checkpoint).run(script)
+    finally:
+        app.store.close()
+        limit_cache.close()
+
+
+def open_store(path=None):
+    """
+    The store for `path`: SQLite for .sqlite3 / .sqlite / .db files,
+    the JSON journal otherwise.
+    """
+    if path and path.lower().endswith((".sqlite3", ".sqlite", ".db")):
+        from persistence.sqlite_store import SQLiteStore  # sqlite3 only when used
+        return SQLiteStore(path)
+    return PersistenceStore(path)
+
+
+def serve(address, store_dir=None, warm=True):
+    # Only server mode pays for asyncio
+    import asyncio
+    from interface.server import Server
+
+    host, _, port = address.rpartition(":")
+    server = Server(MLangApplication, host or "127.0.0.1", int(port), store_dir)
+
+    def ready(listener):
+        for sock in listener.sockets:
+            print("MLang server listening on %s:%s" % sock.getsockname()[:2], flush=True)
+        if warm:
+            warm_imports()
+
+    try:
+        asyncio.run(server.serve_forever(on_ready=ready))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
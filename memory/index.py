@@ -0,0 +1,107 @@
+import math
+
+
+def trigrams(term):
+    """
+    Character trigrams of a term, padded so that its start and end count.
+    """
+    padded = f"  {' '.join(term.lower().split())} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def edit_distance(a, b, limit):
+    """
+    Insertions, deletions, substitutions and swaps of adjacent letters
+    that turn `a` into `b`, or limit + 1 once it is certain to exceed
+    `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    before, previous = None, list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y))
+            if i > 1 and j > 1 and x == b[j - 2] and a[i - 2] == y:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class TrigramIndex:
+    """
+    Fuzzy lookup of known terms by trigram similarity.
+
+    Similarity is the Dice coefficient of the two trigram sets,
+    2·|A ∩ B| / (|A| + |B|). A term can only reach `threshold` if it
+    shares at least m = ceil(t·|A| / (2 − t)) trigrams with the query, so
+    candidates are collected from the query's |A| − m + 1 rarest trigrams
+    only; the frequent ones ("ion", "  s", ...) are never scanned. Terms
+    whose trigram count is too far from the query's to reach the threshold
+    are rejected before their sets are intersected.
+    Adding and removing a term touches only its own trigrams.
+    """
+
+    THRESHOLD = 0.6
+
+    def __init__(self, terms=()):
+        self.grams = {}       # term -> trigram set
+        self.postings = {}    # trigram -> set of terms
+        for term in terms:
+            self.add(term)
+
+    def __len__(self):
+        return len(self.grams)
+
+    def __contains__(self, term):
+        return term in self.grams
+
+    def add(self, term):
+        if term in self.grams:
+            return
+        grams = self.grams[term] = trigrams(term)
+        for gram in grams:
+            self.postings.setdefault(gram, set()).add(term)
+
+    def remove(self, term):
+        grams = self.grams.pop(term, None)
+        if grams is None:
+            return
+        for gram in grams:
+            posting = self.postings[gram]
+            posting.discard(term)
+            if not posting:
+                del self.postings[gram]
+
+    def search(self, query, limit=5, threshold=None):
+        """
+        Known terms similar to `query`, best first, as (term, score).
+        Ties are broken alphabetically so results are deterministic.
+        """
+        threshold = TrigramIndex.THRESHOLD if threshold is None else threshold
+        query_grams = trigrams(query)
+        size = len(query_grams)
+
+        needed = max(1, math.ceil(threshold * size / (2 - threshold)))
+        rarest = sorted(query_grams, key=lambda g: len(self.postings.get(g, ())))
+        candidates = set()
+        for gram in rarest[:size - needed + 1]:
+            candidates.update(self.postings.get(gram, ()))
+
+        shortest = threshold * size / (2 - threshold)
+        longest = (2 - threshold) * size / threshold
+        scored = []
+        for term in candidates:
+            grams = self.grams[term]
+            if not shortest <= len(grams) <= longest:
+                continue
+            score = 2 * len(query_grams & grams) / (size + len(grams))
+            if score >= threshold:
+                scored.append((term, score))
+
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
@@ -1,3 +1,6 @@
+from memory.index import TrigramIndex
+
+
 class KnowledgeSource:
     CORE = "core"
     USER = "user"
@@ -6,18 +9,41 @@ class KnowledgeSource:
 class Memory:
     def __init__(self):
         self.user_knowledge = {}
+        self._index = None
+        # Bumped on every change, so cached answers can tell they are stale
+        self.version = 0
 
     # -------- Learning --------
     def learn(self, concept, definition):
-        self.user_knowledge[concept.lower()] = definition
+        concept = concept.lower()
+        self.user_knowledge[concept] = definition
+        self.version += 1
+        if self._index is not None:
+            self._index.add(concept)
 
     def forget(self, concept):
-        return self.user_knowledge.pop(concept.lower(), None)
+        concept = concept.lower()
+        if self._index is not None:
+            self._index.remove(concept)
+        definition = self.user_knowledge.pop(concept, None)
+        if definition is not None:
+            self.version += 1
+        return definition
 
     # -------- Query --------
     def get(self, concept):
         return self.user_knowledge.get(concept.lower())
 
+    def similar(self, concept, limit=5):
+        """
+        Stored concepts spelled like `concept`, best first, as
+        (concept, score). The index is built on the first lookup, so a
+        lazily loaded store is not read in full at startup.
+        """
+        if self._index is None:
+            self._index = TrigramIndex(self.user_knowledge)
+        return self._index.search(concept, limit)
+
     def summarize(self, concept, core_definition=None):
         result = []
         if core_definition:
@@ -33,4 +59,6 @@ class Memory:
         return self.user_knowledge
 
     def load(self, data):
-        self.user_knowledge = data or {}
+        self.user_knowledge = {} if data is None else data
+        self._index = None
+        self.version += 1
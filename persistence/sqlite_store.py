@@ -0,0 +1,397 @@
+import json
+import sqlite3
+import sys
+from array import array
+from collections.abc import MutableMapping
+
+from core.dataset import Dataset
+from persistence.store import DELETED, Sync, _encode
+
+
+class LazySection(MutableMapping):
+    """
+    A store section that reads rows on first access.
+
+    Values are cached once read. Assignments and deletions only touch the
+    cache and mark the key dirty; SQLiteStore.save writes the dirty keys.
+    `base` keeps the store generation each dirty key was changed against.
+    Membership tests query the key alone, without reading the value.
+    """
+
+    def __init__(self, store, section):
+        self._store = store
+        self._section = section
+        self._cache = {}
+        self._absent = set()
+        self.dirty = set()
+        self.base = {}
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            return self._cache[key]
+        if key in self._absent:
+            raise KeyError(key)
+
+        value = self._store._fetch(self._section, key)
+        if value is DELETED:
+            self._absent.add(key)
+            raise KeyError(key)
+        self._cache[key] = value
+        return value
+
+    def __contains__(self, key):
+        if key in self._cache:
+            return True
+        if key in self._absent:
+            return False
+        return self._store._has(self._section, key)
+
+    def __setitem__(self, key, value):
+        # Storing the value already held (a merge from another process) is
+        # not a change
+        if key not in self.dirty and self._cache.get(key, DELETED) is value:
+            return
+        self._cache[key] = value
+        self._absent.discard(key)
+        self._changed(key)
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._cache.pop(key, None)
+        self._absent.add(key)
+        self._changed(key)
+
+    def _changed(self, key):
+        self.dirty.add(key)
+        self.base.setdefault(key, self._store._generation)
+
+    def __iter__(self):
+        keys = set(self._store._keys(self._section)) | self._cache.keys()
+        return iter(sorted(keys - self._absent))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"LazySection({self._section!r}, {len(self._cache)} loaded)"
+
+    def invalidate(self):
+        """
+        Forget cached values that have no unsaved change, so they are
+        read again (another process may have written them).
+        """
+        for key in list(self._cache):
+            if key not in self.dirty:
+                del self._cache[key]
+        self._absent &= self.dirty
+
+    def settle(self, key, value):
+        """
+        Take another process's value (DELETED if it removed the key) and
+        drop the unsaved change.
+        """
+        self.dirty.discard(key)
+        self.base.pop(key, None)
+        if value is DELETED:
+            self._cache.pop(key, None)
+            self._absent.add(key)
+        else:
+            self._cache[key] = value
+            self._absent.discard(key)
+
+    def saved(self):
+        self.dirty.clear()
+        self.base.clear()
+
+
+class SQLiteStore:
+    """
+    SQLite-backed store with one row per dataset, concept, definition and
+    entry in sketch mode.
+
+    Drop-in alternative to PersistenceStore (same load / save / refresh /
+    close). Loading is constant time: the data and knowledge sections come
+    back as LazySection mappings, and rows are read when first used.
+    `save` writes only what changed, as upserts and deletes in a single
+    transaction. Datasets are stored as raw little-endian doubles; loaded
+    files (Dataset.source) as their reference.
+
+    The database runs in WAL mode, so readers in other processes are never
+    blocked by a writer. Changes made by another process are noticed
+    through PRAGMA data_version.
+
+    Every save bumps a generation number kept in the database, and stamps
+    the rows it writes (and a tombstone for each row it deletes) with it.
+    A change is made against the generation its process had seen; if the
+    row was stamped later, another process changed it first. As with
+    PersistenceStore, that is a conflict: the other process's value wins
+    and is returned with the merged changes.
+    """
+
+    FILE = "mlang_store.sqlite3"
+    SECTIONS = ("data_store", "user_knowledge", "derived", "sketches")
+    LAZY = ("data_store", "user_knowledge")
+    # Few and needed up front (definitions build the dependency graph)
+    EAGER = ("derived", "sketches")
+
+    def __init__(self, path=None):
+        self.path = path or SQLiteStore.FILE
+        self._db = None
+        self._lazy = {}
+        self._state = {}
+        self._version = None
+        self._generation = 0
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " section TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " generation INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (section, key)) WITHOUT ROWID"
+            )
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(entries)")]
+            if "generation" not in columns:
+                # Written before conflicts were detected
+                self._db.execute(
+                    "ALTER TABLE entries ADD COLUMN generation INTEGER NOT NULL DEFAULT 0"
+                )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS deleted ("
+                " section TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " generation INTEGER NOT NULL,"
+                " PRIMARY KEY (section, key)) WITHOUT ROWID"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS meta ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    # --------------------------------------------------
+    # LOAD
+    # --------------------------------------------------
+    def load(self):
+        db = self._connect()
+        self._lazy = {s: LazySection(self, s) for s in SQLiteStore.LAZY}
+
+        eager = {s: self._read_section(s) for s in SQLiteStore.EAGER}
+        self._state = {s: dict(values) for s, values in eager.items()}
+        self._version = self._data_version()
+        self._generation = self._read_generation()
+
+        return {**self._lazy, **eager}
+
+    def _read_section(self, section):
+        return {
+            key: json.loads(value)
+            for key, value in self._connect().execute(
+                "SELECT key, value FROM entries WHERE section = ?", (section,)
+            )
+        }
+
+    def _fetch(self, section, key):
+        row = self._connect().execute(
+            "SELECT value FROM entries WHERE section = ? AND key = ?", (section, key)
+        ).fetchone()
+        if row is None:
+            return DELETED
+        return _decode(section, row[0])
+
+    def _has(self, section, key):
+        return self._connect().execute(
+            "SELECT 1 FROM entries WHERE section = ? AND key = ?", (section, key)
+        ).fetchone() is not None
+
+    def _keys(self, section):
+        return [
+            key for (key,) in self._connect().execute(
+                "SELECT key FROM entries WHERE section = ?", (section,)
+            )
+        ]
+
+    def _data_version(self):
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_generation(self):
+        row = self._connect().execute(
+            "SELECT value FROM meta WHERE name = 'generation'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _stamp(self, section, key):
+        """
+        The generation that last wrote or deleted the key (0: never).
+        """
+        row = self._connect().execute(
+            "SELECT generation FROM entries WHERE section = ? AND key = ?"
+            " UNION ALL"
+            " SELECT generation FROM deleted WHERE section = ? AND key = ?",
+            (section, key, section, key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    # --------------------------------------------------
+    # CHANGES FROM OTHER PROCESSES
+    # --------------------------------------------------
+    def refresh(self):
+        """
+        If another process committed since the last look, drop cached
+        values (they are read again on use) and return changed definitions
+        and sketch-mode flags.
+        """
+        version = self._data_version()
+        if version == self._version:
+            return {}
+        self._version = version
+        self._generation = self._read_generation()
+
+        for section in self._lazy.values():
+            section.invalidate()
+
+        merged = {}
+        for section in SQLiteStore.EAGER:
+            theirs = self._read_section(section)
+            ours = self._state.get(section, {})
+            for key in ours.keys() | theirs.keys():
+                if key not in theirs:
+                    merged[(section, key)] = DELETED
+                elif ours.get(key) != theirs[key]:
+                    merged[(section, key)] = theirs[key]
+            self._state[section] = theirs
+        return merged
+
+    # --------------------------------------------------
+    # SAVE
+    # --------------------------------------------------
+    def save(self, data_store, user_knowledge, derived=None, sketches=None):
+        current = {
+            "data_store": data_store,
+            "user_knowledge": user_knowledge,
+            "derived": derived or {},
+            "sketches": sketches or {},
+        }
+
+        # (section, key, value, generation the change was made against)
+        changes = []
+        for section, values in current.items():
+            if isinstance(values, LazySection) and values._store is self:
+                for key in values.dirty:
+                    changes.append((
+                        section, key, values._cache.get(key, DELETED), values.base[key]
+                    ))
+                continue
+
+            # Changed since the last refresh, which merged everything older
+            previous = self._state.setdefault(section, {})
+            for key, value in values.items():
+                if previous.get(key) is not value:
+                    changes.append((section, key, value, self._generation))
+            for key in previous.keys() - values.keys():
+                changes.append((section, key, DELETED, self._generation))
+
+        if not changes:
+            return Sync(False, self.refresh(), [])
+
+        merged = self.refresh()
+        db = self._connect()
+        theirs = {}
+        # IMMEDIATE: no other process can write between the check and the write
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            seen = self._read_generation()
+            generation = seen + 1
+            writes = []
+            for section, key, value, base in changes:
+                if self._stamp(section, key) > base:
+                    theirs[(section, key)] = self._fetch(section, key)
+                else:
+                    writes.append((section, key, value))
+
+            db.executemany(
+                "DELETE FROM entries WHERE section = ? AND key = ?",
+                [(s, k) for s, k, v in writes if v is DELETED]
+            )
+            db.executemany(
+                "INSERT INTO deleted (section, key, generation) VALUES (?, ?, ?)"
+                " ON CONFLICT (section, key) DO UPDATE SET generation = excluded.generation",
+                [(s, k, generation) for s, k, v in writes if v is DELETED]
+            )
+            db.executemany(
+                "INSERT INTO entries (section, key, value, generation) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (section, key) DO UPDATE"
+                " SET value = excluded.value, generation = excluded.generation",
+                [(s, k, _encode_row(s, v), generation) for s, k, v in writes if v is not DELETED]
+            )
+            db.executemany(
+                "DELETE FROM deleted WHERE section = ? AND key = ?",
+                [(s, k) for s, k, v in writes if v is not DELETED]
+            )
+            db.execute(
+                "INSERT INTO meta (name, value) VALUES ('generation', ?)"
+                " ON CONFLICT (name) DO UPDATE SET value = excluded.value",
+                (generation,)
+            )
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+
+        # If another process saved since the last refresh, the next refresh
+        # catches up (data_version does not count this connection's commits)
+        if seen == self._generation:
+            self._generation = generation
+
+        for section, values in current.items():
+            if isinstance(values, LazySection) and values._store is self:
+                values.saved()
+            else:
+                self._state[section] = dict(values)
+
+        for (section, key), value in theirs.items():
+            values = current[section]
+            if isinstance(values, LazySection) and values._store is self:
+                values.settle(key, value)
+            elif value is DELETED:
+                self._state[section].pop(key, None)
+            else:
+                self._state[section][key] = value
+
+        merged.update(theirs)
+        return Sync(bool(writes), merged, list(theirs))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def _encode_row(section, value):
+    if section == "data_store" and isinstance(value, Dataset) and value.source is None:
+        raw = value.values
+        if sys.byteorder != "little":
+            raw = array("d", raw)
+            raw.byteswap()
+        return memoryview(raw).cast("B").tobytes()
+    return json.dumps(value, separators=(",", ":"), default=_encode)
+
+
+def _decode(section, raw):
+    if isinstance(raw, bytes):
+        values = array("d")
+        values.frombytes(raw)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return Dataset(values)
+
+    value = json.loads(raw)
+    return Dataset.coerce(value) if section == "data_store" else value
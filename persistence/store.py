@@ -1,24 +1,476 @@
 import json
 import os
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+from core.dataset import Dataset
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks: single-process use only
+    fcntl = None
+
+
+# Result of save(): whether anything was written, the changes other
+# processes made that were merged in ({(section, key): value or DELETED}),
+# and the (section, key) pairs of ours rejected because another process
+# changed them first.
+Sync = namedtuple("Sync", ["written", "merged", "conflicts"])
+
+# A log read from `end` back: its generation, entries, and what the file
+# looked like when opened ((inode, size, mtime), to notice later writes)
+Log = namedtuple("Log", ["generation", "entries", "seen", "end"])
+
+DELETED = None
+
+
+# A log entry that adds encoded values to the end of a stored dataset
+Append = namedtuple("Append", ["values"])
+
+
+def _apply(values, key, value):
+    """
+    Apply one log entry to a section.
+    """
+    if value is DELETED:
+        values.pop(key, None)
+    elif isinstance(value, Append):
+        values[key] = Dataset.coerce(values[key]).appended(Dataset.coerce(value.values))
+    else:
+        values[key] = value
+
+
+def _encode(value):
+    if isinstance(value, Dataset):
+        return value.encode()
+    raise TypeError(f"Cannot store {type(value).__name__}")
+
+
+def _header_generation(line, default):
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return default
+    if isinstance(entry, dict) and entry.get("op") == "begin":
+        return entry["generation"]
+    return default
+
+
+def _seen(st):
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), default=_encode)
 
 
 class PersistenceStore:
+    """
+    Journaled store that several processes can share.
+
+    The snapshot file holds the last compacted state and its generation.
+    Every change made after it is appended to a log as one JSON line; the
+    log starts with a header naming the generation it applies on top of.
+    Once the log grows past `compact_bytes` it is rotated, and a background
+    thread folds it into the next snapshot.
+
+    `save` only writes the keys whose values changed since the last call,
+    so a command that did not mutate anything costs no disk I/O at all.
+    Values are compared by identity: datasets and definitions are replaced
+    on assignment, never edited in place. Datasets are written in their
+    compact encoded form (see core/dataset.py); a dataset made by appending
+    to the one last saved under its key is logged as the new values only.
+
+    Concurrency:
+    - Writers append and rotate under an exclusive lock on `<path>.lock`.
+      Snapshots are written to a temporary file and renamed into place.
+    - Before appending, a writer replays what other processes appended
+      since it last looked (optimistic check on the log's inode and size).
+      Their changes are merged and returned to the caller. A key that both
+      sides changed is a conflict: the other process's value wins.
+    - Readers (load, refresh) take no lock. They check the generations
+      of snapshot and logs and retry if a compaction got in between.
+    """
+
     FILE = "mlang_store.json"
+    COMPACT_BYTES = 1 << 20
+    SECTIONS = ("data_store", "user_knowledge", "derived", "sketches")
+
+    # Lock-free load attempts before falling back to the writer lock
+    READ_RETRIES = 5
+
+    def __init__(self, path=None, compact_bytes=None):
+        self.path = path or PersistenceStore.FILE
+        self.log_path = self.path + ".log"
+        self.old_log_path = self.log_path + ".old"
+        self.lock_path = self.path + ".lock"
+        self.compact_lock_path = self.path + ".compact.lock"
+        self.compact_bytes = (
+            PersistenceStore.COMPACT_BYTES if compact_bytes is None else compact_bytes
+        )
+
+        self._state = {s: {} for s in PersistenceStore.SECTIONS}
+        # Position in the current log up to which _state is up to date
+        self._generation = 0
+        self._seen = None
+        self._offset = 0
+
+        self._lock = threading.Lock()
+        self._compactor = None
+
+    # --------------------------------------------------
+    # LOAD
+    # --------------------------------------------------
+    def load(self):
+        for _ in range(PersistenceStore.READ_RETRIES):
+            result = self._read()
+            if result is not None:
+                break
+        else:
+            with self._locked():
+                result = self._read()
+
+        state, self._generation, self._seen, self._offset = result
+        state["data_store"] = {
+            name: Dataset.coerce(values)
+            for name, values in state["data_store"].items()
+        }
+        self._state = {s: dict(v) for s, v in state.items()}
+
+        # A leftover ".old" log nobody is folding means a compaction was
+        # interrupted; finish it
+        if os.path.exists(self.old_log_path):
+            self._start_fold()
+
+        return state
+
+    def _read(self):
+        """
+        Snapshot plus logs, or None when a compaction replaced the snapshot
+        while the logs were being read.
+        """
+        state = {s: {} for s in PersistenceStore.SECTIONS}
+
+        try:
+            with open(self.path, "r") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {}
+        generation = snapshot.get("generation", 0)
+        for section in PersistenceStore.SECTIONS:
+            state[section].update(snapshot.get(section) or {})
+
+        # Logs older than the snapshot are already folded into it; each
+        # remaining one must continue exactly where the previous one ends
+        current, seen, offset = generation, None, 0
+        for path in (self.old_log_path, self.log_path):
+            log = self._read_log(path, generation)
+            if log is None:
+                continue
+            if log.generation < generation:
+                continue
+            if log.generation > generation:
+                return None
+
+            for section, key, value in log.entries:
+                _apply(state[section], key, value)
+            generation = current = log.generation + 1
+            if path == self.log_path:
+                current, seen, offset = log.generation, log.seen, log.end
+
+        # `current` is the generation of the log new entries go to
+        return state, current, seen, offset
 
-    @staticmethod
-    def load():
-        if not os.path.exists(PersistenceStore.FILE):
-            return {"data_store": {}, "user_knowledge": {}}
+    def _read_log(self, path, default_generation, start=0):
+        """
+        The complete lines of a log from `start` on, or None if it is
+        missing. A line still being written is left for later.
+        """
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            return None
 
-        with open(PersistenceStore.FILE, "r") as f:
-            return json.load(f)
+        with f:
+            st = os.fstat(f.fileno())
+            generation = _header_generation(f.readline(), default_generation)
+            f.seek(start)
+            data = f.read()
 
-    @staticmethod
-    def save(data_store, user_knowledge):
-        payload = {
+        entries = []
+        end = start
+
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break  # torn line from a crash
+            end += len(line)
+
+            if entry.get("section") in self._state:
+                if entry["op"] == "set":
+                    value = entry["value"]
+                elif entry["op"] == "append":
+                    value = Append(entry["value"])
+                else:
+                    value = DELETED
+                entries.append((entry["section"], entry["key"], value))
+
+        return Log(generation, entries, _seen(st), end)
+
+    # --------------------------------------------------
+    # CHANGES FROM OTHER PROCESSES
+    # --------------------------------------------------
+    def refresh(self):
+        """
+        Pick up what other processes saved since the last call, without
+        locking. Returns {(section, key): value or DELETED}; the caller
+        applies it to its live state.
+        """
+        if not self._stale():
+            return {}
+        return self._catch_up() or {}
+
+    def _stale(self):
+        try:
+            st = os.stat(self.log_path)
+        except FileNotFoundError:
+            return self._seen is not None
+        return (st.st_ino, st.st_size, st.st_mtime_ns) != self._seen
+
+    def _catch_up(self):
+        if self._seen is not None:
+            # Same file as before (inode numbers get reused, generations
+            # do not): only the tail is new
+            log = self._read_log(self.log_path, -1, self._offset)
+            if (
+                log is not None
+                and log.seen[0] == self._seen[0]
+                and log.generation == self._generation
+            ):
+                self._seen, self._offset = log.seen, log.end
+                return self._merge(
+                    ((section, key), value) for section, key, value in log.entries
+                )
+
+        # The log was rotated since we last looked: compare everything
+        for _ in range(PersistenceStore.READ_RETRIES):
+            result = self._read()
+            if result is not None:
+                break
+        else:
+            return None
+
+        state, self._generation, self._seen, self._offset = result
+        changes = []
+        for section in PersistenceStore.SECTIONS:
+            ours, theirs = self._state[section], state[section]
+            for key in ours.keys() | theirs.keys():
+                if key not in theirs:
+                    changes.append(((section, key), DELETED))
+                elif key not in ours or _canonical(ours[key]) != _canonical(theirs[key]):
+                    changes.append(((section, key), theirs[key]))
+        return self._merge(changes)
+
+    def _merge(self, changes):
+        merged = {}
+        for (section, key), value in changes:
+            if section == "data_store" and value is not DELETED and not isinstance(value, Append):
+                value = Dataset.coerce(value)
+            _apply(self._state[section], key, value)
+            merged[(section, key)] = self._state[section].get(key, DELETED)
+        return merged
+
+    # --------------------------------------------------
+    # SAVE
+    # --------------------------------------------------
+    def save(self, data_store, user_knowledge, derived=None, sketches=None):
+        current = {
             "data_store": data_store,
             "user_knowledge": user_knowledge,
+            "derived": derived or {},
+            "sketches": sketches or {},
         }
 
-        with open(PersistenceStore.FILE, "w") as f:
-            json.dump(payload, f, indent=2)
+        ours = {}
+        for section, values in current.items():
+            previous = self._state[section]
+
+            for key, value in values.items():
+                if previous.get(key) is not value:
+                    ours[(section, key)] = value
+
+            for key in previous.keys() - values.keys():
+                ours[(section, key)] = DELETED
+
+        if not ours:
+            return Sync(False, self.refresh(), [])
+
+        with self._locked():
+            merged = self._catch_up() if self._stale() else {}
+            if merged is None:
+                # A compaction kept moving the files; try again next time
+                return Sync(False, {}, [])
+            conflicts = [k for k in ours if k in merged]
+            lines = [
+                self._entry(section, key, value)
+                for (section, key), value in ours.items()
+                if (section, key) not in merged
+            ]
+
+            if lines:
+                self._append(lines)
+                for (section, key), value in ours.items():
+                    if (section, key) in merged:
+                        continue
+                    if value is DELETED:
+                        self._state[section].pop(key, None)
+                    else:
+                        self._state[section][key] = value
+
+            if self._offset >= self.compact_bytes:
+                self._rotate()
+
+        return Sync(bool(lines), merged, conflicts)
+
+    def _entry(self, section, key, value):
+        entry = {"op": "set" if value is not DELETED else "delete",
+                 "section": section, "key": key}
+        previous = self._state[section].get(key)
+        if isinstance(value, Dataset) and value.extends(previous):
+            # Only the appended values, not the whole dataset again
+            entry["op"] = "append"
+            value = Dataset(value.values[len(previous):])
+        if value is not DELETED:
+            entry["value"] = value
+        return json.dumps(entry, separators=(",", ":"), default=_encode) + "\n"
+
+    def _append(self, lines):
+        with open(self.log_path, "ab+") as f:
+            size = f.seek(0, os.SEEK_END)
+
+            if size == 0:
+                lines.insert(0, self._header(self._generation))
+            elif (
+                size > self._offset
+                and self._seen is not None
+                and os.fstat(f.fileno()).st_ino == self._seen[0]
+            ):
+                # Bytes past what we replayed under the lock can only be a
+                # line torn by a writer that crashed
+                f.truncate(self._offset)
+                f.seek(self._offset)
+
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            self._offset = f.tell()
+            self._seen = _seen(os.fstat(f.fileno()))
+
+    def _header(self, generation):
+        return json.dumps({"op": "begin", "generation": generation}) + "\n"
+
+    @contextmanager
+    def _locked(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    # --------------------------------------------------
+    # COMPACTION
+    # --------------------------------------------------
+    def compact(self):
+        """
+        Rotate the log and fold it into a new snapshot in the background.
+        New changes keep going to a fresh log while the snapshot is written.
+        Does nothing while another fold is running, or when other processes
+        saved changes this store has not picked up yet.
+        """
+        with self._locked():
+            if not self._stale():
+                self._rotate()
+
+    def _rotate(self):
+        # Called with the file lock held and the log fully replayed
+        if os.path.exists(self.old_log_path) or not os.path.exists(self.log_path):
+            return
+
+        os.replace(self.log_path, self.old_log_path)
+        self._generation += 1
+        with open(self.log_path, "w") as f:
+            f.write(self._header(self._generation))
+            f.flush()
+            self._offset = f.tell()
+            self._seen = _seen(os.fstat(f.fileno()))
+
+        self._start_fold()
+
+    def _start_fold(self):
+        with self._lock:
+            if self._compactor is not None and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._fold)
+            self._compactor.start()
+
+    def _fold(self):
+        """
+        Snapshot + rotated log -> next snapshot. Only one process folds at a
+        time; a fold left unfinished by a crash is picked up by the next one.
+        """
+        if fcntl is None:
+            self._fold_locked()
+            return
+
+        with open(self.compact_lock_path, "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another process is folding
+            try:
+                self._fold_locked()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _fold_locked(self):
+        try:
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = {}
+        generation = state.get("generation", 0)
+
+        log = self._read_log(self.old_log_path, generation)
+        if log is None:
+            return
+
+        if log.generation == generation:
+            for section in PersistenceStore.SECTIONS:
+                state.setdefault(section, {})
+            for section, key, value in log.entries:
+                _apply(state[section], key, value)
+            state["generation"] = generation + 1
+            self._write_snapshot(state)
+
+        # Folded now or by an earlier, interrupted run
+        os.remove(self.old_log_path)
+
+    def _write_snapshot(self, state):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, separators=(",", ":"), default=_encode)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def close(self):
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
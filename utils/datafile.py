@@ -0,0 +1,211 @@
+import ast
+import csv
+import mmap
+import os
+import sys
+from array import array
+
+from core.dataset import Dataset
+
+
+# Extension -> format
+EXTENSIONS = {
+    ".csv": "csv",
+    ".npy": "npy",
+    ".bin": "f64",
+    ".f64": "f64",
+}
+
+FORMAT_NAMES = {
+    "csv": "CSV text",
+    "npy": "a NumPy .npy array",
+    "f64": "raw little-endian 64-bit floats",
+}
+
+NPY_MAGIC = b"\x93NUMPY"
+
+# .npy element types that can be read (after conversion) -> array typecode
+NPY_TYPES = {
+    "f8": "d", "f4": "f",
+    "i8": "q", "i4": "i", "i2": "h", "i1": "b",
+    "u8": "Q", "u4": "I", "u2": "H", "u1": "B",
+}
+
+
+class DataFileError(ValueError):
+    pass
+
+
+def load(path, column=None):
+    """
+    Read a numeric dataset from `path`, picking the format from the
+    extension. Binary files are memory-mapped: native little-endian
+    float64 data is used in place, without copying, so a file larger
+    than memory can still be queried. Other element types are converted.
+
+    The returned Dataset remembers where it came from (Dataset.source),
+    so the store keeps the reference instead of the values.
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        known = ", ".join(sorted(EXTENSIONS))
+        raise DataFileError(f"I can read {known} files, not '{os.path.basename(path)}'")
+    if column is not None and fmt != "csv":
+        raise DataFileError("Columns can only be chosen in CSV files")
+
+    try:
+        if fmt == "csv":
+            values = _read_csv(path, column)
+        elif fmt == "npy":
+            values = _map_npy(path)
+        else:
+            values = _map(path, 0, "<f8")
+    except OSError as exc:
+        raise DataFileError(f"Cannot read '{path}': {exc.strerror or exc}") from exc
+
+    dataset = Dataset(values)
+    dataset.source = {"path": path, "format": fmt, "column": column}
+    return dataset
+
+
+def reopen(source):
+    """
+    The dataset a stored file reference points to. A file that has gone
+    missing gives an empty dataset that keeps the reference.
+    """
+    try:
+        return load(source["path"], source.get("column"))
+    except DataFileError:
+        dataset = Dataset()
+        dataset.source = source
+        return dataset
+
+
+def describe(source):
+    return FORMAT_NAMES[source["format"]]
+
+
+# --------------------------------------------------
+# BINARY
+# --------------------------------------------------
+def _map(path, offset, descr, count=None):
+    """
+    Map `count` elements of type `descr` (e.g. '<f8') starting at byte
+    `offset`. Native float64 comes back as a read-only memoryview over the
+    mapping; anything else is converted into an array('d').
+    """
+    order, kind = descr[0], descr[1:]
+    typecode = NPY_TYPES.get(kind)
+    if typecode is None:
+        raise DataFileError(f"Unsupported element type '{descr}'")
+    itemsize = array(typecode).itemsize
+
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if count is None:
+            if (size - offset) % itemsize:
+                raise DataFileError(
+                    f"'{os.path.basename(path)}' is not a whole number of "
+                    f"{itemsize}-byte values"
+                )
+            count = (size - offset) // itemsize
+        if offset + count * itemsize > size:
+            raise DataFileError(f"'{os.path.basename(path)}' is truncated")
+        if count == 0:
+            return array("d")
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(mapped)[offset:offset + count * itemsize].cast(typecode)
+    swap = order in "<>" and (order == "<") != (sys.byteorder == "little")
+
+    if typecode == "d" and not swap:
+        return view
+
+    values = array(typecode, view)
+    if swap:
+        values.byteswap()
+    return values if typecode == "d" else array("d", values)
+
+
+def _map_npy(path):
+    with open(path, "rb") as f:
+        magic = f.read(8)
+        if magic[:6] != NPY_MAGIC:
+            raise DataFileError(f"'{os.path.basename(path)}' is not a .npy file")
+        major = magic[6]
+        length_bytes = 2 if major == 1 else 4
+        header_len = int.from_bytes(f.read(length_bytes), "little")
+        header = f.read(header_len).decode("latin1")
+
+    try:
+        meta = ast.literal_eval(header)
+        descr, shape = meta["descr"], tuple(meta["shape"])
+    except (ValueError, SyntaxError, KeyError, TypeError):
+        raise DataFileError(f"'{os.path.basename(path)}' has an unreadable header")
+
+    if not isinstance(descr, str):
+        raise DataFileError("Structured .npy arrays are not supported")
+    if sum(1 for n in shape if n != 1) > 1:
+        raise DataFileError(f"Expected a single column of numbers, got shape {shape}")
+
+    count = 1
+    for n in shape:
+        count *= n
+    return _map(path, 8 + length_bytes + header_len, descr, count)
+
+
+# --------------------------------------------------
+# CSV
+# --------------------------------------------------
+def _read_csv(path, column):
+    values = array("d")
+
+    with open(path, "r", newline="") as f:
+        rows = csv.reader(f)
+        first = next(rows, None)
+        if first is None:
+            return values
+
+        header = None
+        try:
+            [float(v) for v in first]
+        except ValueError:
+            header = [name.strip().lower() for name in first]
+        index = _column_index(first, header, column, path)
+
+        if header is None:
+            values.append(float(first[index]))
+
+        for line, row in enumerate(rows, 2):
+            if not row:
+                continue
+            try:
+                values.append(float(row[index]))
+            except (ValueError, IndexError):
+                raise DataFileError(
+                    f"Line {line} of '{os.path.basename(path)}' has no number "
+                    f"in column {index + 1}"
+                )
+
+    return values
+
+
+def _column_index(first, header, column, path):
+    if column is None:
+        if len(first) != 1:
+            raise DataFileError(
+                f"'{os.path.basename(path)}' has {len(first)} columns; "
+                "say which one, e.g. 'column 2'"
+            )
+        return 0
+
+    if column.isdigit():
+        index = int(column) - 1
+        if not 0 <= index < len(first):
+            raise DataFileError(f"There is no column {column}")
+        return index
+
+    if header is None or column.lower() not in header:
+        raise DataFileError(f"There is no column named '{column}'")
+    return header.index(column.lower())
@@ -0,0 +1,219 @@
+import ast
+import math
+import re
+from functools import lru_cache
+
+from utils.optional import numpy
+
+
+FUNCTIONS = {
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "sinh": math.sinh,
+    "cosh": math.cosh,
+    "tanh": math.tanh,
+    "exp": math.exp,
+    "log": math.log,
+    "ln": math.log,
+    "log10": math.log10,
+    "sqrt": math.sqrt,
+    "abs": abs,
+}
+
+# (fewest, most) arguments; every other function takes exactly one
+ARITY = {
+    "log": (1, 2),
+}
+
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name,
+    ast.Constant, ast.Load,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.UAdd, ast.USub,
+)
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def _float_pow(base, exponent):
+    # Powers are taken in floating point: 9^9^9 overflows at once instead
+    # of building an enormous integer
+    if isinstance(base, int):
+        base = float(base)
+    return base ** exponent
+
+
+class _FloatPowers(ast.NodeTransformer):
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if not isinstance(node.op, ast.Pow):
+            return node
+        return ast.copy_location(
+            ast.Call(
+                func=ast.Name(id="__pow", ctx=ast.Load()),
+                args=[node.left, node.right],
+                keywords=[]
+            ),
+            node
+        )
+
+
+def normalize(text):
+    """
+    Rewrite everyday notation into Python syntax:
+    ^ for powers, implicit products such as 2x, 3(x + 1) and (x)(y).
+    """
+    text = text.strip().lower()
+    text = text.replace("^", "**").replace("×", "*").replace("÷", "/")
+
+    # 2x -> 2*x, 3(x+1) -> 3*(x+1); leaves exponents such as 2e5 alone
+    text = re.sub(r"(\d)(?!e[+-]?\d)\s*(?=[a-z_(])", r"\1*", text)
+    # (x)(y) -> (x)*(y), (x)y -> (x)*y
+    text = re.sub(r"\)\s*(?=[\w(])", ")*", text)
+    # x(y+1) -> x*(y+1) unless x is a known function
+    text = re.sub(
+        r"\b([a-z_]\w*)\s*\(",
+        lambda m: m.group(0) if m.group(1) in FUNCTIONS else f"{m.group(1)}*(",
+        text
+    )
+    # Canonical spacing, so trivially different inputs share a cache entry
+    text = re.sub(r"\s*([-+*/%(),])\s*", r"\1", text)
+    return " ".join(text.split())
+
+
+def compile_expression(text):
+    """
+    Parse, validate and compile `text` once; repeated calls with the same
+    normalized text return the cached Expression.
+    """
+    return _compile(normalize(text))
+
+
+@lru_cache(maxsize=512)
+def _compile(source):
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as exc:
+        raise ExpressionError(f"Cannot parse '{source}'") from exc
+
+    names, called = set(), set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ExpressionError(f"'{source}' uses unsupported syntax")
+
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ExpressionError(f"'{source}' contains a non-numeric literal")
+
+        if isinstance(node, ast.Call):
+            if (
+                not isinstance(node.func, ast.Name)
+                or node.func.id not in FUNCTIONS
+                or node.keywords
+            ):
+                raise ExpressionError(f"'{source}' calls an unknown function")
+
+            fewest, most = ARITY.get(node.func.id, (1, 1))
+            if not fewest <= len(node.args) <= most:
+                raise ExpressionError(
+                    f"'{source}' gives {node.func.id} the wrong number of arguments"
+                )
+            called.add(id(node.func))
+
+        if isinstance(node, ast.Name) and node.id not in FUNCTIONS:
+            names.add(node.id)
+
+    # A function name is only valid as the function of a call
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id in FUNCTIONS and id(node) not in called:
+            raise ExpressionError(f"'{source}' uses {node.id} without an argument")
+
+    tree = _FloatPowers().visit(tree)
+
+    variables = tuple(sorted(names - CONSTANTS.keys()))
+    return Expression(source, tree, variables)
+
+
+class Expression:
+    """
+    A validated arithmetic expression, compiled to a Python function of
+    its free variables.
+    """
+
+    def __init__(self, source, tree, variables):
+        self.source = source
+        self.variables = variables
+        self._tree = tree
+        self._functions = {}
+
+    def __repr__(self):
+        return f"Expression({self.source!r})"
+
+    def function(self, *variables, vector=False):
+        """
+        A callable taking `variables` positionally (default: all free
+        variables in sorted order). With vector=True the math functions
+        are NumPy's, so the callable accepts arrays.
+        """
+        variables = variables or self.variables
+        missing = set(self.variables) - set(variables)
+        if missing:
+            raise ExpressionError(f"No value for {', '.join(sorted(missing))}")
+
+        key = (variables, vector)
+        if key not in self._functions:
+            lam = ast.Expression(ast.Lambda(
+                args=ast.arguments(
+                    posonlyargs=[],
+                    args=[ast.arg(arg=v) for v in variables],
+                    kwonlyargs=[], kw_defaults=[], defaults=[]
+                ),
+                body=self._tree.body
+            ))
+            ast.fix_missing_locations(lam)
+            functions = _numpy_functions() if vector else FUNCTIONS
+            scope = {
+                "__builtins__": {}, "__pow": _float_pow,
+                **functions, **CONSTANTS
+            }
+            self._functions[key] = eval(compile(lam, "<mlang>", "eval"), scope)
+        return self._functions[key]
+
+    def evaluate(self, **values):
+        return self.function(*sorted(values))(*(values[k] for k in sorted(values)))
+
+    def vectorized(self, variable):
+        """
+        A function of one variable that maps over a whole sequence:
+        through NumPy when it is installed, element by element otherwise.
+        """
+        np = numpy()
+        if np is None:
+            f = self.function(variable)
+            return lambda xs: [f(x) for x in xs]
+
+        f = self.function(variable, vector=True)
+        return lambda xs: np.broadcast_to(f(np.asarray(xs, dtype=float)), np.shape(xs))
+
+
+@lru_cache(maxsize=1)
+def _numpy_functions():
+    np = numpy()
+    functions = {name: getattr(np, name) for name in FUNCTIONS if hasattr(np, name)}
+    functions.update(
+        asin=np.arcsin, acos=np.arccos, atan=np.arctan,
+        ln=np.log, abs=np.abs,
+        # np.log's second argument is `out`, not a base
+        log=lambda x, base=None: np.log(x) if base is None else np.log(x) / np.log(base),
+    )
+    return functions
@@ -0,0 +1,15 @@
+_numpy = None
+
+
+def numpy():
+    """
+    NumPy if it is installed, imported on first use to keep startup light.
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            numpy = False
+        _numpy = numpy
+    return _numpy or None
@@ -0,0 +1,193 @@
+import math
+import sys
+from collections import namedtuple
+from functools import lru_cache
+
+from utils.optional import numpy
+
+
+Quadrature = namedtuple(
+    "Quadrature", ["value", "error", "converged", "panels", "evaluations"]
+)
+
+# Points per panel of the Gauss-Legendre rule
+ORDER = 10
+
+# Bisection levels before giving up on an interval
+MAX_DEPTH = 30
+
+# Upper bound on intervals refined at the same level
+MAX_ACTIVE = 4096
+
+# Divergence test for intervals still unresolved below SINGULAR_WIDTH of
+# the range. Next to an integrable singularity (1/sqrt(x), log(x),
+# 1/x^0.9) the half touching it holds a shrinking part of its interval's
+# estimate; next to 1/x it holds all of it (and more, for 1/x^2). A half
+# keeping SINGULAR_RATIO of its parent, while still SINGULAR_SHARE of the
+# result, means the area there is unbounded.
+SINGULAR_WIDTH = 2.0 ** -20
+SINGULAR_RATIO = 0.99
+SINGULAR_SHARE = 1e-3
+
+
+class DivergentIntegral(ArithmeticError):
+    """
+    The integral has no finite value; `point` is where it blows up.
+    """
+
+    def __init__(self, point):
+        super().__init__(f"the integral diverges near {point}")
+        self.point = point
+
+
+@lru_cache(maxsize=8)
+def legendre(n):
+    """
+    Nodes and weights of the n-point Gauss-Legendre rule on [-1, 1],
+    found by Newton iteration on the Legendre polynomial P_n.
+    """
+    nodes, weights = [], []
+
+    for i in range(1, n + 1):
+        x = math.cos(math.pi * (i - 0.25) / (n + 0.5))
+        for _ in range(100):
+            p0, p1 = 1.0, x
+            for k in range(2, n + 1):
+                p0, p1 = p1, ((2 * k - 1) * x * p1 - (k - 1) * p0) / k
+            dp = n * (x * p1 - p0) / (x * x - 1)
+            step = p1 / dp
+            x -= step
+            if abs(step) < 1e-16:
+                break
+
+        nodes.append(x)
+        weights.append(2 / ((1 - x * x) * dp * dp))
+
+    return nodes, weights
+
+
+def _estimates(f, intervals):
+    """
+    Gauss-Legendre estimate on each (lo, hi) interval.
+    `f` is called once, on the sample points of every interval together.
+    """
+    nodes, weights = legendre(ORDER)
+    np = numpy()
+
+    if np is not None:
+        bounds = np.asarray(intervals, dtype=float)
+        centers = bounds.mean(axis=1)
+        halves = (bounds[:, 1] - bounds[:, 0]) / 2
+        points = (centers[:, None] + halves[:, None] * np.asarray(nodes)[None, :]).ravel()
+        # log(-1) and 1/0 become nan/inf, checked below, instead of warnings
+        with np.errstate(all="ignore"):
+            values = np.asarray(f(points), dtype=float).reshape(len(intervals), ORDER)
+        if not np.all(np.isfinite(values)):
+            raise ArithmeticError("integrand is not finite on the interval")
+        return (halves * (values @ np.asarray(weights))).tolist()
+
+    points = [
+        (lo + hi) / 2 + (hi - lo) / 2 * node
+        for lo, hi in intervals
+        for node in nodes
+    ]
+    values = list(f(points))
+    if not all(map(math.isfinite, values)):
+        raise ArithmeticError("integrand is not finite on the interval")
+
+    return [
+        (hi - lo) / 2 * math.fsum(
+            w * v for w, v in zip(weights, values[i * ORDER:(i + 1) * ORDER])
+        )
+        for i, (lo, hi) in enumerate(intervals)
+    ]
+
+
+def _finite(f, points):
+    """
+    Whether f is finite at each point.
+    """
+    np = numpy()
+    if np is not None:
+        with np.errstate(all="ignore"):
+            return np.isfinite(np.asarray(f(points), dtype=float)).tolist()
+    return [math.isfinite(v) for v in f(points)]
+
+
+def integrate(f, a, b, tol=1e-10):
+    """
+    Integrate f over [a, b] with adaptive Gauss-Legendre quadrature.
+
+    Every interval is compared against the sum of its two halves; those
+    that agree within their share of `tol` are accepted, the others are
+    bisected again. The tolerance is absolute, scaled up by the size of
+    the result when that exceeds 1. All intervals of a level are sampled
+    in a single call of `f`, which takes a sequence of points and returns
+    their values (see utils.expression.Expression.vectorized).
+
+    Raises DivergentIntegral when an interval around a singularity keeps
+    its share of the area however narrow it gets, and ArithmeticError
+    when f is not finite at a sample point.
+    """
+    if a == b:
+        return Quadrature(0.0, 0.0, True, 0, 0)
+
+    width = abs(b - a)
+    first = _estimates(f, [(a, b)])[0]
+    scale = max(1.0, abs(first))
+
+    active = [(a, b, first)]
+    parts, errors = [], []
+    evaluations = ORDER
+
+    for depth in range(MAX_DEPTH):
+        halves = []
+        for lo, hi, _ in active:
+            mid = (lo + hi) / 2
+            halves += [(lo, mid), (mid, hi)]
+
+        estimates = _estimates(f, halves)
+        # The Gauss points never include an interval's midpoint, so the
+        # halves of 1/x on [-1, 1] cancel exactly; a midpoint where f is not
+        # finite always needs refining
+        finite = _finite(f, [lo + (hi - lo) / 2 for lo, hi, _ in active])
+        evaluations += len(halves) * ORDER + len(active)
+
+        last_level = depth == MAX_DEPTH - 1 or len(active) * 2 > MAX_ACTIVE
+        refine = []
+
+        for k, (lo, hi, whole) in enumerate(active):
+            left, right = estimates[2 * k], estimates[2 * k + 1]
+            diff = abs(left + right - whole)
+
+            # This interval's share of the tolerance, but never below what
+            # rounding alone can explain
+            local_tol = max(
+                tol * scale * abs(hi - lo) / width,
+                4 * sys.float_info.epsilon * abs(whole)
+            )
+            resolved = diff <= local_tol and finite[k]
+            if not math.isfinite(left + right):
+                raise ArithmeticError("integrand is not finite on the interval")
+            if not resolved and abs(hi - lo) < width * SINGULAR_WIDTH:
+                piece = max(abs(left), abs(right))
+                if piece >= SINGULAR_RATIO * abs(whole) and piece > SINGULAR_SHARE * scale:
+                    # Located to a millionth of the range; + 0.0 drops a -0.0
+                    digits = 6 - math.floor(math.log10(width))
+                    raise DivergentIntegral(round((lo + hi) / 2, digits) + 0.0)
+            if resolved or last_level:
+                parts.append(left + right)
+                # An unresolved pole makes the error unknown
+                errors.append(diff if finite[k] else math.inf)
+            else:
+                mid = (lo + hi) / 2
+                refine += [(lo, mid, left), (mid, hi, right)]
+
+        active = refine
+        if not active:
+            break
+
+    error = math.fsum(errors)
+    return Quadrature(
+        math.fsum(parts), error, error <= tol * scale, len(parts), evaluations
+    )